@@ -1,95 +1,323 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory, abort, Response
+import time
+from flask import Flask, Request, render_template, request, jsonify, redirect, url_for, send_from_directory, abort, Response
 from markupsafe import Markup
 import sqlite3
 import os
+import sys
 import json
 import logging
+import importlib
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
-import pandas as pd
-import glob
-import openpyxl
-from flasgger import Swagger, swag_from
+import numpy as np
 from flask import Blueprint
-import time
 from werkzeug.utils import secure_filename
 import shutil
-import markdown2
-import datetime as dt
+import tempfile
+import threading
+import copy
+import hashlib
+import uuid
+import queue
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+from utils.pages import pages_lock, write_json_atomic, normalize_page_orders, commit_page_changes
+from utils.shared_cache import SharedCache
+from utils.images import ImageVariants, IMAGE_FORMATS, is_image
+from utils.markdown_render import MarkdownRenderer
+from utils.workbooks import WorkbookCache, SidecarStore, InvalidWorkbookError, is_table_source
+from utils.concurrency import SingleFlight, run_native
+from utils.snapshots import SnapshotStore, WidgetEngine
+from utils.events import EventBroker, EventBus
+from utils.watcher import FileWatcher
+try:
+    import brotli
+except ImportError:  # Optional: only gzip variants are pre-compressed without it
+    brotli = None
 
-# Helper function to safely convert to float
+# Heavy modules (openpyxl, pandas, pyarrow, flasgger) are imported on first
+# use, so workers start quickly and only pay for what their requests need.
+# Under gunicorn, the time taken to import this module is recorded here too
+# (see import_app in gunicorn.conf.py).
+startup_timings = {}
 
-def safe_float(val):
-    if val is None:
-        return None
-    if isinstance(val, dt.datetime):
-        return None
-    if isinstance(val, (int, float)):
-        return float(val)
-    if isinstance(val, str):
+def lazy_import(name):
+    """Import a module on first use, recording how long the import took"""
+    if name in sys.modules:
+        # Goes through the import lock: waits if another thread is still importing it
+        return importlib.import_module(name)
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    key = f'import {name}'
+    if key not in startup_timings:
+        startup_timings[key] = round(time.perf_counter() - started, 4)
+        app.logger.info(f"Imported {name} in {startup_timings[key]:.3f}s")
+    return module
+
+# Small files read by nearly every request
+GLOBAL_CONFIG_PATH = os.path.join('pages', 'config.json')
+I18N_FOLDER = os.path.join('static', 'i18n')
+LOGO_PATHS = {
+    'main_logo_exists': os.path.join('static', 'assets', 'main_logo.png'),
+    'secondary_logo_exists': os.path.join('static', 'assets', 'secondary_logo.png')
+}
+SITE_CHECK_INTERVAL = float(os.environ.get('SITE_CHECK_INTERVAL', '1'))
+
+class SiteState:
+    """In-memory copies of the global config, translations, VERSION and logos.
+
+    Each file is parsed once and reloaded only after its (mtime, size, inode)
+    changes; the files are stat()ed at most every `check_interval` seconds.
+    Every change seen by any worker bumps a single site version kept in the
+    `site_meta` table, with a conditional UPDATE so that workers noticing the
+    same change bump it only once. Clients and caches can key on it.
+    """
+
+    def __init__(self, db_path, check_interval=1.0):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._fingerprints = None
+        self._values = {}
+        self._checked = 0.0
+        self._version = 0
+        self.loads = 0
+
+    def _paths(self):
+        paths = [GLOBAL_CONFIG_PATH, 'VERSION', *LOGO_PATHS.values()]
         try:
-            return float(val)
-        except ValueError:
+            paths += sorted(os.path.join(I18N_FOLDER, name) for name in os.listdir(I18N_FOLDER) if name.endswith('.json'))
+        except OSError:
+            pass
+        return paths
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
             return None
-    return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
 
-# Import version utilities
-def get_version():
-    """Read version from VERSION file"""
+    def _sync_version(self, fingerprints):
+        """Bump the shared site version if it was recorded for other file versions; return it"""
+        digest = hashlib.sha1(repr(sorted(fingerprints.items())).encode('utf-8')).hexdigest()
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS site_meta (
+                        key TEXT PRIMARY KEY,
+                        version INTEGER NOT NULL,
+                        fingerprint TEXT NOT NULL
+                    )
+                """)
+                conn.execute("INSERT OR IGNORE INTO site_meta (key, version, fingerprint) VALUES ('site', 1, ?)", (digest,))
+                conn.execute("UPDATE site_meta SET version = version + 1, fingerprint = ? "
+                             "WHERE key = 'site' AND fingerprint != ?", (digest, digest))
+                return conn.execute("SELECT version FROM site_meta WHERE key = 'site'").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _read_version(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            row = conn.execute("SELECT version FROM site_meta WHERE key = 'site'").fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else self._version
+
+    def refresh(self, force=False):
+        """Re-stat the files if the check interval has passed (or force) and drop changed ones"""
+        if not force and time.monotonic() - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._checked < self.check_interval:
+                return
+            fingerprints = {path: self._stat(path) for path in self._paths()}
+            try:
+                if fingerprints != self._fingerprints:
+                    previous = self._fingerprints or {}
+                    for path in fingerprints.keys() | previous.keys():
+                        if fingerprints.get(path) != previous.get(path):
+                            self._values.pop(path, None)
+                    self._fingerprints = fingerprints
+                    version = self._sync_version(fingerprints)
+                else:
+                    # Pick up bumps made by other workers for changes seen there first
+                    version = self._read_version()
+                self._version = max(self._version, version)
+            except sqlite3.Error as e:
+                app.logger.error(f"Error syncing site version: {e}")
+                if self._fingerprints is fingerprints:
+                    self._version += 1
+            self._checked = time.monotonic()
+
+    @property
+    def version(self):
+        """Monotonic version of the global config, translations, VERSION and logos"""
+        self.refresh()
+        return self._version
+
+    def fingerprint(self, path):
+        self.refresh()
+        return self._fingerprints.get(path)
+
+    def get(self, path, loader):
+        """Return loader(path), parsed once per version of the file"""
+        self.refresh()
+        with self._lock:
+            if path in self._values:
+                return self._values[path]
+        value = loader(path)
+        self.loads += 1
+        with self._lock:
+            self._values[path] = value
+        return value
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'files': len(self._values),
+            'loads': self.loads
+        }
+
+def _read_version_file(path):
     try:
-        with open('VERSION', 'r') as f:
+        with open(path, 'r') as f:
             return f.read().strip()
     except FileNotFoundError:
         return "0.0.0"
 
-def get_global_config():
-    """Get global configuration from /pages/config.json"""
-    config_path = os.path.join('pages', 'config.json')
-    if os.path.exists(config_path):
+def _read_json_file(path):
+    if os.path.exists(path):
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
+            with open(path, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except Exception as e:
-            app.logger.error(f"Error reading config: {e}")
+            app.logger.error(f"Error reading {path}: {e}")
     return {}
 
+def get_version():
+    """Read version from VERSION file"""
+    return site_state.get('VERSION', _read_version_file)
+
+def get_global_config():
+    """Get global configuration from /pages/config.json"""
+    # Callers may modify the result: hand out a copy of the cached one
+    return copy.deepcopy(site_state.get(GLOBAL_CONFIG_PATH, _read_json_file))
+
 def load_translations(language='pt'):
     """Load translations for the specified language"""
-    try:
-        i18n_path = os.path.join('static', 'i18n', f'{language}.json')
-        if os.path.exists(i18n_path):
-            with open(i18n_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        else:
-            # Fallback to Portuguese if language file doesn't exist
-            fallback_path = os.path.join('static', 'i18n', 'pt.json')
-            if os.path.exists(fallback_path):
-                with open(fallback_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-    except Exception as e:
-        app.logger.error(f"Error loading translations for {language}: {e}")
-    
-    # Return empty dict if no translations found
-    return {}
+    i18n_path = os.path.join(I18N_FOLDER, f'{language}.json')
+    if site_state.fingerprint(i18n_path) is None:
+        # Fallback to Portuguese if language file doesn't exist
+        i18n_path = os.path.join(I18N_FOLDER, 'pt.json')
+    return dict(site_state.get(i18n_path, _read_json_file))
 
 def check_logo_files():
     """Check which logo files exist and return their availability"""
-    main_logo_path = os.path.join('static', 'assets', 'main_logo.png')
-    secondary_logo_path = os.path.join('static', 'assets', 'secondary_logo.png')
-    
-    return {
-        'main_logo_exists': os.path.exists(main_logo_path),
-        'secondary_logo_exists': os.path.exists(secondary_logo_path)
-    }
+    return {key: site_state.fingerprint(path) is not None for key, path in LOGO_PATHS.items()}
+
+# While the filesystem watcher is running, stat results of the files it
+# watches are remembered until it reports a change, so request paths do not
+# need to touch the disk. Other files (templates, stylesheets, the upload
+# caches) are always stat'ed: nothing would tell when they change.
+_fingerprint_cache = {}
+_fingerprint_cache_enabled = False
+
+def file_fingerprint(path):
+    """Return (mtime_ns, size, inode) for a file, or None if it does not exist"""
+    path = os.path.abspath(path)
+    cached = _fingerprint_cache_enabled and fs_watcher.covers(path)
+    if cached and path in _fingerprint_cache:
+        return _fingerprint_cache[path]
+    try:
+        st = os.stat(path)
+        fingerprint = (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        fingerprint = None
+    if cached:
+        _fingerprint_cache[path] = fingerprint
+    return fingerprint
+
+def forget_fingerprints(paths=None):
+    """Drop remembered stat results for paths, or all of them"""
+    if paths is None:
+        _fingerprint_cache.clear()
+        return
+    for path in paths:
+        _fingerprint_cache.pop(os.path.abspath(path), None)
+
+# Upload sidecars (see utils/workbooks.py), image variants and compiled markdown
+SIDECAR_DIR = os.path.join('data', '.cache')
+# Cell values are serialized like the API responses
+sidecars = SidecarStore(SIDECAR_DIR, dumps=lambda obj: app.json.dumps(obj))
+
+workbook_cache = WorkbookCache(int(os.environ.get('WORKBOOK_CACHE_SIZE', '64')), file_fingerprint, sidecars, lazy_import)
+
+image_variants = ImageVariants(os.path.join(SIDECAR_DIR, 'images'), int(os.environ.get('IMAGE_QUALITY', '82')))
+
+def image_sources(filename):
+    """Return (url, sources) to show a data image, generating its display variants on first use.
+
+    `sources` lists {'type', 'srcset'} per format for a <picture> element.
+    Without Pillow, or for a file it cannot read, the original file is used.
+    """
+    path = os.path.join('data', filename)
+    fingerprint = file_fingerprint(path)
+    if not image_variants.available or fingerprint is None or not is_image(filename):
+        return f'/data/{filename}', []
+    try:
+        digest = image_variants.digest(path, fingerprint)
+        # Resizing a large photo takes a while: only one worker does it
+        variants = shared_cache.single_flight(f'image:{digest}', lambda: image_variants.existing(digest),
+                                              lambda: image_variants.generate(path, digest))
+    except Exception as e:
+        app.logger.error(f"Error generating display variants of {filename}: {e}")
+        return f'/data/{filename}', []
+    sources = [{'type': mimetype,
+                'srcset': ', '.join(f'/media/{name} {width}w' for name, width in variants.get(ext, []))}
+               for ext, _, mimetype in IMAGE_FORMATS]
+    return f'/media/{variants["jpg"][0][0]}', sources
+
+markdown_renderer = MarkdownRenderer(os.path.join(SIDECAR_DIR, 'markdown'))
+
+def is_markdown(filename):
+    return filename.lower().endswith('.md')
+
+def prune_markdown_renders():
+    """Delete rendered HTML of markdown files that are no longer in data/"""
+    keep = set()
+    for name in os.listdir('data'):
+        path = os.path.join('data', name)
+        if is_markdown(name) and not name.startswith('.') and os.path.isfile(path):
+            try:
+                keep.add(markdown_renderer.render(path, file_fingerprint(path))[0])
+            except (OSError, UnicodeDecodeError) as e:
+                app.logger.error(f"Error rendering {name}: {e}")
+    return markdown_renderer.prune(keep)
+
+def prune_image_variants():
+    """Delete display variants of images that are no longer in data/"""
+    keep = set()
+    for name in os.listdir('data'):
+        path = os.path.join('data', name)
+        if is_image(name) and not name.startswith('.') and os.path.isfile(path):
+            keep.add(image_variants.digest(path, file_fingerprint(path)))
+    return image_variants.prune(keep)
 
 def get_version_info():
     """Get comprehensive version information"""
     version = get_version()
     global_config = get_global_config()
+    version_fingerprint = site_state.fingerprint('VERSION')
+    build_date = datetime.fromtimestamp(version_fingerprint[0] / 1e9) if version_fingerprint else datetime.now()
     
     return {
         'version': version,
-        'build_date': datetime.now().isoformat(),
+        'site_version': site_state.version,
+        'build_date': build_date.isoformat(),
         'app_name': 'PDashboard',
         'description': 'Dashboard Fabril Modular',
         'company': global_config.get('company_name', 'Company Name')
@@ -107,6 +335,10 @@ app.config['SWAGGER'] = {
     'specs_route': '/api/v1/docs/'
 }
 
+# Upload limits: the whole request (Flask answers 413 above it) and each file
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ.get('MAX_UPLOAD_MB', '200')) * 1024 * 1024)
+MAX_UPLOAD_FILE_SIZE = int(float(os.environ.get('MAX_UPLOAD_FILE_MB', '50')) * 1024 * 1024)
+
 def setup_logging():
     """Setup logging configuration for the application"""
     # Create logs directory if it doesn't exist
@@ -157,8 +389,11 @@ def setup_logging():
     return app.logger
 
 # Database initialization
+DB_PATH = 'dashboard.db'
+site_state = SiteState(DB_PATH, SITE_CHECK_INTERVAL)
+
 def init_db():
-    conn = sqlite3.connect('dashboard.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS pages (
@@ -196,6 +431,8 @@ def init_db():
     try:
         resolve_duplicate_orders(cursor)
         conn.commit()
+        with pages_lock():
+            normalize_page_orders('pages')
         app.logger.info("Order index resolution completed on startup")
     except Exception as e:
         app.logger.error(f"Error during startup order resolution: {e}")
@@ -289,80 +526,372 @@ def discover_pages(cursor):
     # Resolve any duplicate order indexes after discovering all pages
     resolve_duplicate_orders(cursor)
 
+class PageRegistry:
+    """In-memory registry of the page configs found under pages/.
+
+    Parsed configs are kept sorted by order with precomputed indexes by
+    page_id, by sequential id and by active flag. Configs are only reparsed
+    when their file changes: the filesystem watcher and the mutating routes
+    call invalidate(); without a running watcher, each lookup re-stats the
+    config files but still skips parsing unchanged ones.
+    """
+
+    def __init__(self, pages_dir='pages'):
+        self.pages_dir = pages_dir
+        self.version = None
+        self._lock = threading.Lock()
+        self._configs = {}
+        self._stale = True
+        self._stale_dirs = set()
+        self._pages = []
+        self._by_page_id = {}
+        self._by_seq_id = {}
+        self._active = []
+        self._active_by_id = {}
+
+    def config_path(self, page_dir):
+        return os.path.join(self.pages_dir, page_dir, 'config.json')
+
+    def invalidate(self, page_dirs=None):
+        """Mark page folders (or everything) as changed on disk"""
+        with self._lock:
+            if page_dirs is None:
+                self._stale = True
+                forget_fingerprints(self.config_path(d) for d in self._configs)
+            else:
+                self._stale_dirs.update(page_dirs)
+                forget_fingerprints(self.config_path(d) for d in page_dirs)
+
+    def _refresh(self):
+        if not fs_watcher.running:
+            self._stale = True
+        if not self._stale and not self._stale_dirs:
+            return
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not self._stale and not self._stale_dirs:
+                return
+            if self._stale:
+                if os.path.exists(self.pages_dir):
+                    page_dirs = [d for d in os.listdir(self.pages_dir)
+                                 if os.path.isdir(os.path.join(self.pages_dir, d))]
+                else:
+                    page_dirs = []
+                for removed in set(self._configs) - set(page_dirs):
+                    del self._configs[removed]
+            else:
+                page_dirs = list(self._stale_dirs)
+
+            changed = False
+            for page_dir in page_dirs:
+                config_file = self.config_path(page_dir)
+                fingerprint = file_fingerprint(config_file)
+                cached = self._configs.get(page_dir)
+                if cached is not None and cached[0] == fingerprint:
+                    continue
+                changed = True
+                if fingerprint is None:
+                    self._configs.pop(page_dir, None)
+                    continue
+                try:
+                    with open(config_file, 'r', encoding='utf-8') as f:
+                        config = json.load(f)
+                    config['_dir'] = page_dir  # Store directory name
+                    self._configs[page_dir] = (fingerprint, config)
+                except Exception as e:
+                    app.logger.error(f"Error loading page config {config_file}: {e}")
+                    self._configs.pop(page_dir, None)
+            if changed or self.version is None:
+                self._build_indexes()
+            # Cleared last, so concurrent lookups wait for the new indexes
+            self._stale = False
+            self._stale_dirs = set()
+
+    def _build_indexes(self):
+        # Sort by order field if present, otherwise alphabetically
+        configs = sorted((config for _, config in self._configs.values()),
+                         key=lambda x: (x.get('order', 999), x.get('title', '')))
+        pages = []
+        for i, config in enumerate(configs):
+            pages.append({
+                'id': i + 1,  # Sequential ID for compatibility
+                'page_id': config['id'],
+                'title': config['title'],
+                'description': config.get('description', ''),
+                'icon': config.get('icon', '📄'),
+                'type': config.get('type', 'default'),
+                'active': config.get('active', True),
+                'order': config.get('order', i + 1),
+                'config': config
+            })
+        # Active pages are served as their config plus page_id, for consistency with get_pages()
+        active = [{**config, 'page_id': config['id']} for config in configs if config.get('active', False)]
+        self._pages = pages
+        self._by_page_id = {page['page_id']: page for page in pages}
+        self._by_seq_id = {page['id']: page for page in pages}
+        self._active = active
+        self._active_by_id = {page['id']: page for page in active}
+        self.version = hashlib.sha1(json.dumps(
+            sorted((d, fp) for d, (fp, _) in self._configs.items())).encode('utf-8')).hexdigest()[:16]
+
+    def pages(self):
+        """All pages in get_pages() format, sorted by order (shared, read-only)"""
+        self._refresh()
+        return self._pages
+
+    def page(self, page_id):
+        self._refresh()
+        return self._by_page_id.get(page_id)
+
+    def page_by_seq_id(self, seq_id):
+        self._refresh()
+        return self._by_seq_id.get(seq_id)
+
+    def active_pages(self):
+        """Active page configs sorted by order (shared, read-only)"""
+        self._refresh()
+        return self._active
+
+    def active_page(self, page_id):
+        self._refresh()
+        return self._active_by_id.get(page_id)
+
+page_registry = PageRegistry('pages')
+
 def get_pages():
     """Get all pages with their configuration from config.json files"""
-    pages = []
-    pages_dir = 'pages'
-    
-    if not os.path.exists(pages_dir):
-        return pages
-    
-    # Get all subdirectories in pages/
-    page_dirs = [d for d in os.listdir(pages_dir) 
-                 if os.path.isdir(os.path.join(pages_dir, d))]
-    
-    # Sort by order if specified in config, otherwise alphabetically
-    page_configs = []
-    for page_dir in page_dirs:
-        config_file = os.path.join(pages_dir, page_dir, 'config.json')
-        if os.path.exists(config_file):
-            try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                config['_dir'] = page_dir  # Store directory name
-                page_configs.append(config)
-            except Exception as e:
-                app.logger.error(f"Error loading page config {config_file}: {e}")
-    
-    # Check for duplicate orders in config files and resolve them
-    order_values = [config.get('order', 999) for config in page_configs]
-    if len(order_values) != len(set(order_values)):
-        app.logger.warning("Found duplicate order values in config files, resolving...")
-        # Reassign order values sequentially
-        for i, config in enumerate(page_configs):
-            config['order'] = i + 1
-            # Update the config file
-            config_file = os.path.join(pages_dir, config['_dir'], 'config.json')
-            try:
-                with open(config_file, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, indent=2, ensure_ascii=False)
-                app.logger.info(f"Updated order for {config['id']} to {i + 1}")
-            except Exception as e:
-                app.logger.error(f"Error updating config file {config_file}: {e}")
-    
-    # Sort by order field if present, otherwise alphabetically
-    page_configs.sort(key=lambda x: (x.get('order', 999), x.get('title', '')))
-    
-    for i, config in enumerate(page_configs):
-        pages.append({
-            'id': i + 1,  # Sequential ID for compatibility
-            'page_id': config['id'],
-            'title': config['title'],
-            'description': config.get('description', ''),
-            'icon': config.get('icon', '📄'),
-            'type': config.get('type', 'default'),
-            'active': config.get('active', True),
-            'order': config.get('order', i + 1),
-            'config': config
-        })
-    
-    return pages
+    return page_registry.pages()
 
 def get_active_pages():
-    pages = []
-    for page_folder in os.listdir('pages'):
-        config_path = os.path.join('pages', page_folder, 'config.json')
-        if os.path.exists(config_path):
-            with open(config_path, encoding='utf-8') as f:
-                config = json.load(f)
-            if config.get('active', False):
-                # Add page_id field for consistency with get_pages()
-                config['page_id'] = config['id']
-                pages.append(config)
-    
-    # Sort pages by order field
-    pages.sort(key=lambda x: x.get('order', 999))
-    return pages
+    return page_registry.active_pages()
+
+# --- Widget computation engine ---
+
+DATA_PAGE_TYPES = ('3x2', '2x2', '2x1-graph', '2x2-cards')
+
+def _present(values):
+    """Boolean mask of the cells that hold a value"""
+    return np.not_equal(values, None).astype(bool) if len(values) else np.zeros(0, dtype=bool)
+
+def _target_color(value_num, target_num):
+    """Return (value_color, arrow) comparing a value against its target (NaN when missing)"""
+    if np.isnan(target_num):
+        return '#fff', None
+    if np.isnan(value_num):
+        return None, None
+    if value_num >= target_num:
+        return '#0bda5b', '▲'
+    return '#fa6238', '▼'
+
+def compute_trend(numeric):
+    """Return (trend, trend_color, abs_change, percent_change) for the last two values"""
+    if numeric.size < 2 or np.isnan(numeric[-2:]).any():
+        return '', 'gray', None, 0
+    prev_num, curr_num = numeric[-2:]
+    abs_change = float(curr_num - prev_num)
+    percent_change = float(abs_change / prev_num * 100) if prev_num != 0 else 0
+    if abs_change > 0:
+        return '▲', 'green', abs_change, percent_change
+    if abs_change < 0:
+        return '▼', 'red', abs_change, percent_change
+    return '→', 'gray', abs_change, percent_change
+
+def kpi_columns(widget_cfg):
+    return [(widget_cfg.get('column_month', 'Mês'), 0),
+            (widget_cfg.get('column_total', 'Total'), 1),
+            (widget_cfg.get('column_target', 'Meta'), 2)]
+
+def graph_columns(widget_cfg):
+    return [(widget_cfg.get('column_month', 'Mês'), 0),
+            (widget_cfg.get('column_real', 'Real'), None),
+            (widget_cfg.get('column_fct', 'FCT'), None),
+            (widget_cfg.get('column_bgt', 'BGT'), None)]
+
+def card_columns(page):
+    return [(page.get('column_title', 'Title'), 0),
+            (page.get('column_value', 'Value'), 1),
+            (page.get('column_icon', 'Icon'), 2),
+            (page.get('column_target', 'Target'), None)]
+
+def build_kpi_widget(widget_cfg, sheet):
+    """Build a 3x2/2x2 widget: last total against target, with trend and history"""
+    idx_month, idx_total, idx_target = (sheet.index(name, default) for name, default in kpi_columns(widget_cfg))
+    totals = sheet.column(idx_total)
+    # Only require total to be present, target can be None
+    rows = _present(totals)
+    totals_num = sheet.numeric(idx_total)[rows]
+    targets_num = sheet.numeric(idx_target)[rows]
+    totals = totals[rows]
+    targets = sheet.column(idx_target)[rows]
+
+    value = totals[-1] if totals.size else 0
+    value_num = totals_num[-1] if totals_num.size else 0.0
+    target_num = targets_num[-1] if targets_num.size else np.nan
+    trend, trend_color, abs_change, percent_change = compute_trend(totals_num)
+    value_color, _ = _target_color(value_num, target_num)
+    widget = {
+        'id': widget_cfg['id'],
+        'name': widget_cfg['name'],
+        'title': widget_cfg['name'],
+        'type': widget_cfg.get('type', 'line'),
+        'labels': sheet.column(idx_month)[rows].tolist(),
+        'chart_data': totals.tolist(),
+        'value': value,
+        'target': targets[-1] if not np.isnan(target_num) else None,
+        'value_color': value_color or '#fa6238',
+        'trend': trend,
+        'trend_color': trend_color,
+        'percent_change': round(percent_change, 1)
+    }
+    if abs_change is not None:
+        widget['abs_change'] = abs_change
+    return widget
+
+def build_graph_widget(widget_cfg, sheet):
+    """Build a 2x1-graph widget: Real (or FCT when Real is missing) against BGT"""
+    idx_month, idx_real, idx_fct, idx_bgt = (sheet.index(name, default) for name, default in graph_columns(widget_cfg))
+    months = sheet.column(idx_month)
+    rows = _present(months)
+    real = sheet.column(idx_real)[rows]
+    fct = sheet.column(idx_fct)[rows]
+    has_real = _present(real)
+    has_fct = _present(fct) & ~has_real
+    real_or_fct_type = np.where(has_real, 'real', np.where(has_fct, 'fct', None))
+    fct = np.where(has_fct, fct, None)
+
+    return {
+        'id': widget_cfg['id'],
+        'name': widget_cfg['name'],
+        'title': widget_cfg['name'],
+        'type': widget_cfg.get('type', 'bar'),
+        'labels': months[rows].tolist(),
+        'real': real.tolist(),
+        'fct': fct.tolist(),
+        'bgt': sheet.column(idx_bgt)[rows].tolist(),
+        'real_or_fct_type': real_or_fct_type.tolist()
+    }
+
+def build_card_widgets(page, sheet, limit=4):
+    """Build up to four 2x2-cards widgets from a single sheet (Title, Value, Target, Icon)"""
+    idx_title, idx_value, idx_icon, idx_target = (sheet.index(name, default) for name, default in card_columns(page))
+    titles, values, icons = sheet.column(idx_title), sheet.column(idx_value), sheet.column(idx_icon)
+    # Skip rows where all fields are empty/None
+    filled = [any(cell is not None and str(cell).strip() != '' for cell in cells)
+              for cells in zip(titles, values, icons)]
+    rows = np.flatnonzero(filled)[:limit]
+    values_num = sheet.numeric(idx_value)
+    targets_num = sheet.numeric(idx_target)
+    targets = sheet.column(idx_target)
+
+    widgets = []
+    for n, row in enumerate(rows):
+        widget = {
+            'id': f'card{n + 1}',
+            'title': titles[row] if titles[row] is not None else '',
+            'value': values[row] if values[row] is not None else 0,
+            'icon': icons[row] if icons[row] is not None else 'fa-question'
+        }
+        value_color, arrow = _target_color(values_num[row], targets_num[row])
+        if not np.isnan(targets_num[row]):
+            widget['target'] = targets[row]
+        if value_color:
+            widget['value_color'] = value_color
+        if arrow:
+            widget['arrow'] = arrow
+        widgets.append(widget)
+    return widgets
+
+# Page config keys naming the data file, in order of precedence
+DATA_SOURCE_KEYS = ('source', 'xlsx_file', 'csv_file', 'parquet_file')
+# Sheet name of CSV and Parquet sources (see is_table_source)
+TABLE_SHEET = ''
+
+def page_data_file(page):
+    """Return the path of the data file backing a page, or None"""
+    if page.get('type') not in DATA_PAGE_TYPES:
+        return None
+    name = next((page[key] for key in DATA_SOURCE_KEYS if page.get(key)), None)
+    return os.path.join('data', name) if name else None
+
+def page_sheet(page, sheet):
+    """Sheet to read for a page: the configured one, or the single table of a CSV/Parquet source"""
+    return TABLE_SHEET if is_table_source(page_data_file(page)) else sheet
+
+def page_sheet_columns(page):
+    """Return {sheet: [(column_name, default_index), ...]} needed to build a page"""
+    if page['type'] == '2x2-cards':
+        return {page_sheet(page, page.get('sheet', 'Cards')): card_columns(page)}
+    column_specs = graph_columns if page['type'] == '2x1-graph' else kpi_columns
+    wanted = {}
+    for widget_cfg in page.get('widgets', []):
+        if widget_cfg.get('active', True):
+            wanted.setdefault(page_sheet(page, widget_cfg.get('sheet')), []).extend(column_specs(widget_cfg))
+    return wanted
+
+def build_page_widgets(page):
+    """Compute the widget payloads for a data-backed page"""
+    data_path = page_data_file(page)
+    if data_path is None:
+        return []
+    # Extract every sheet the page needs with a single pass over the file
+    sheets = workbook_cache.sheets(data_path, page_sheet_columns(page))
+    if page['type'] == '2x2-cards':
+        return build_card_widgets(page, sheets[page_sheet(page, page.get('sheet', 'Cards'))])
+    builder = build_graph_widget if page['type'] == '2x1-graph' else build_kpi_widget
+    widgets = []
+    for widget_cfg in page.get('widgets', []):
+        if not widget_cfg.get('active', True):
+            continue
+        widgets.append(builder(widget_cfg, sheets[page_sheet(page, widget_cfg.get('sheet'))]))
+    return widgets
+
+single_flight = SingleFlight()
+
+DATA_REFRESH_WORKERS = int(os.environ.get('DATA_REFRESH_WORKERS', '2'))
+DATA_REFRESH_TICK = float(os.environ.get('DATA_REFRESH_TICK', '5'))
+
+snapshot_store = SnapshotStore(DB_PATH, dumps=app.json.dumps)
+
+# Cross-worker cache and leases (see utils/shared_cache.py)
+shared_cache = SharedCache(DB_PATH, int(float(os.environ.get('SHARED_CACHE_SIZE_MB', '64')) * 1024 * 1024),
+                           float(os.environ.get('SHARED_CACHE_LEASE_SECONDS', '60')))
+
+def active_data_pages():
+    return [page for page in get_active_pages() if page.get('type') in DATA_PAGE_TYPES]
+
+def reread_data_file(path):
+    """Make the next read of a data file parse it again even if its fingerprint did not change"""
+    forget_fingerprints([os.path.abspath(path)])
+    workbook_cache.invalidate(path)
+
+# Widget snapshots of the data pages (see utils/snapshots.py)
+widget_engine = WidgetEngine(snapshot_store, shared_cache, build_page_widgets, page_data_file, file_fingerprint,
+                             active_data_pages, reread_data_file, single_flight,
+                             DATA_REFRESH_WORKERS, DATA_REFRESH_TICK)
+
+# --- Conditional GET helpers ---
+
+def make_etag(*parts):
+    """Build a strong ETag value from version parts (fingerprints, hashes...)"""
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:20]
+
+def conditional_response(etag, build, cache_control='no-cache'):
+    """Answer 304 when the client already holds etag; only call build() otherwise"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+        if isinstance(response, tuple):
+            return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def pages_data_version(pages):
+    """Version of the computed data for pages: their configs plus the snapshots served for them"""
+    return make_etag(page_registry.version, [(page['id'], widget_engine.version(page)) for page in pages])
+
+DATA_CACHE_CONTROL = 'public, max-age=30, must-revalidate'
 
 def render_page_with_template(page, widgets):
     css_link = ''
@@ -371,212 +900,52 @@ def render_page_with_template(page, widgets):
     template_name = page.get('template', 'carousel.html')
     return render_template(template_name, pages=[{**page, 'widgets': widgets}], css_link=css_link)
 
-@app.route('/')
-def dashboard_carousel():
-    # Load global config
-    global_config = get_global_config()
-    last_update_month = global_config.get('last_update_month', '')
-    company_name = global_config.get('company_name', 'Company Name')
-    language = global_config.get('language', 'pt')
-    number_format = global_config.get('number_format', ' # ###')
-    
-    # Load translations
-    translations = load_translations(language)
-    
-    # Check logo availability
-    logo_info = check_logo_files()
-    
+def carousel_pages():
+    """The active pages as the carousel shows them, with their widgets, markdown HTML or image sources"""
     pages = get_active_pages()
     rendered_pages = []
     for page in pages:
-        if page['type'] in ('3x2', '2x2', '2x1-graph', '2x2-cards'):
-            xlsx_path = os.path.join('data', page['xlsx_file'])
-            wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-            widgets = []
-            if page['type'] == '2x2-cards':
-                # Read up to 4 cards from a single sheet, each row: Title, Value, Icon
-                sheet_name = page.get('sheet', 'Cards')
-                sheet = wb[sheet_name]
-                
-                # Get header row to find column indices
-                headers = list(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True)))
-                
-                # Get column names from config
-                column_title = page.get('column_title', 'Title')
-                column_value = page.get('column_value', 'Value')
-                column_icon = page.get('column_icon', 'Icon')
-                column_target = page.get('column_target', 'Target')
-                
-                # Find column indices
-                idx_title = headers.index(column_title) if column_title in headers else 0
-                idx_value = headers.index(column_value) if column_value in headers else 1
-                idx_icon = headers.index(column_icon) if column_icon in headers else 2
-                idx_target = headers.index(column_target) if column_target and column_target in headers else None
-                
-                count = 0
-                for row in sheet.iter_rows(min_row=2, values_only=True):
-                    if count >= 4:
-                        break
-                    # Skip rows where all fields are empty/None
-                    if (not row or (all((cell is None or str(cell).strip() == '') for cell in [row[idx_title] if idx_title < len(row) else '', row[idx_value] if idx_value < len(row) else '', row[idx_icon] if idx_icon < len(row) else '']))):
-                        continue
-                    title = row[idx_title] if idx_title < len(row) else ''
-                    value = row[idx_value] if idx_value < len(row) else 0
-                    icon = row[idx_icon] if idx_icon < len(row) else 'fa-question'
-                    widget = {
-                        'title': title,
-                        'value': value,
-                        'icon': icon
-                    }
-                    # Target logic
-                    target = row[idx_target] if idx_target is not None and idx_target < len(row) else None
-                    value_num = safe_float(value)
-                    target_num = safe_float(target)
-                    if target_num is not None:
-                        widget['target'] = target
-                        if value_num is not None:
-                            if value_num >= target_num:
-                                widget['value_color'] = '#0bda5b'
-                                widget['arrow'] = '▲'
-                            else:
-                                widget['value_color'] = '#fa6238'
-                                widget['arrow'] = '▼'
-                    else:
-                        widget['value_color'] = '#fff'
-                    widgets.append(widget)
-                    count += 1
-            else:
-                for widget_cfg in page['widgets']:
-                    if not widget_cfg.get('active', True):
-                        continue
-                    sheet = wb[widget_cfg['sheet']]
-                    months, real, fct, bgt, real_or_fct_type = [], [], [], [], []
-                    
-                    # Get header row to find column indices
-                    headers = list(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True)))
-                    
-                    # Use different column logic based on dashboard type
-                    if page['type'] == '2x1-graph':
-                        # 2x1-graph uses Real/FCT/BGT columns
-                        column_month = widget_cfg.get('column_month', 'Mês')
-                        column_real = widget_cfg.get('column_real', 'Real')
-                        column_fct = widget_cfg.get('column_fct', 'FCT')
-                        column_bgt = widget_cfg.get('column_bgt', 'BGT')
-                        
-                        # Find column indices
-                        idx_month = headers.index(column_month) if column_month in headers else 0
-                        idx_real = headers.index(column_real) if column_real in headers else None
-                        idx_fct = headers.index(column_fct) if column_fct in headers else None
-                        idx_bgt = headers.index(column_bgt) if column_bgt in headers else None
-                    else:
-                        # 3x2 and 2x2 use Total/Target columns
-                        column_month = widget_cfg.get('column_month', 'Mês')
-                        column_total = widget_cfg.get('column_total', 'Total')
-                        column_target = widget_cfg.get('column_target', 'Meta')
-                        
-                        # Find column indices
-                        idx_month = headers.index(column_month) if column_month in headers else 0
-                        idx_total = headers.index(column_total) if column_total in headers else 1
-                        idx_target = headers.index(column_target) if column_target in headers else 2
-                    
-                    for row in sheet.iter_rows(min_row=2, values_only=True):
-                        # Now process data rows
-                        if row[idx_month] is not None:
-                            months.append(row[idx_month])
-                            if page['type'] == '2x1-graph':
-                                # 2x1-graph uses Real/FCT/BGT columns
-                                # Real or FCT
-                                if idx_real is not None and row[idx_real] is not None:
-                                    real.append(row[idx_real])
-                                    fct.append(None)
-                                    real_or_fct_type.append('real')
-                                elif idx_fct is not None and row[idx_fct] is not None:
-                                    real.append(None)
-                                    fct.append(row[idx_fct])
-                                    real_or_fct_type.append('fct')
-                                else:
-                                    real.append(None)
-                                    fct.append(None)
-                                    real_or_fct_type.append(None)
-                                # BGT
-                                bgt.append(row[idx_bgt] if idx_bgt is not None else None)
-                            else:
-                                # 3x2 and 2x2 use Total/Target columns
-                                real.append(row[idx_total] if idx_total is not None else None)
-                                fct.append(None)
-                                real_or_fct_type.append('real')
-                                bgt.append(row[idx_target] if idx_target is not None else None)
-                    
-                    if page['type'] == '2x1-graph':
-                        widgets.append({
-                            "title": widget_cfg['name'],
-                            "type": widget_cfg.get('type', 'bar'),
-                            "labels": months,
-                            "real": real,
-                            "fct": fct,
-                            "bgt": bgt,
-                            "real_or_fct_type": real_or_fct_type
-                        })
-                    else:
-                        # For 3x2 and 2x2, use the chart_data structure and restore color/percent/trend logic
-                        value = real[-1] if real else 0
-                        target = bgt[-1] if bgt else 0
-                        abs_change = None
-                        trend = ''
-                        trend_color = 'gray'
-                        if len(real) >= 2:
-                            prev = real[-2]
-                            curr = real[-1]
-                            prev_num = safe_float(prev)
-                            curr_num = safe_float(curr)
-                            if prev_num is not None and curr_num is not None:
-                                abs_change = curr_num - prev_num
-                                if abs_change > 0:
-                                    trend = '▲'
-                                    trend_color = 'green'
-                                elif abs_change < 0:
-                                    trend = '▼'
-                                    trend_color = 'red'
-                                else:
-                                    trend = '→'
-                                    trend_color = 'gray'
-                        value_num = safe_float(value)
-                        target_num = safe_float(target)
-                        value_color = "#fff" if target_num is None else "#fa6238"
-                        if target_num is not None and value_num is not None:
-                            if value_num >= target_num:
-                                value_color = "#0bda5b"
-                        widget_dict = {
-                            "title": widget_cfg['name'],
-                            "type": widget_cfg.get('type', 'line'),
-                            "labels": months,
-                            "chart_data": real,  # Use real data as chart_data
-                            "value": value,
-                            "value_color": value_color,
-                            "trend": trend,
-                            "trend_color": trend_color,
-                        }
-                        if abs_change is not None:
-                            widget_dict["abs_change"] = abs_change
-                        if target_num is not None:
-                            widget_dict["target"] = target
-                        widgets.append(widget_dict)
+        if page['type'] in DATA_PAGE_TYPES:
+            try:
+                widgets = widget_engine.widgets(page)
+            except Exception as e:
+                app.logger.error(f"Error building widgets for page {page['id']}: {e}")
+                widgets = []
             rendered_pages.append({**page, "widgets": widgets})
         elif page['type'] == 'text-md':
             md_file = page.get('md_file', '')
             font_size = page.get('font_size', '2rem')
             md_path = os.path.join('data', md_file)
-            if os.path.exists(md_path):
-                with open(md_path, 'r', encoding='utf-8') as f:
-                    md_content = f.read()
-                html_content = markdown2.markdown(md_content, extras=["fenced-code-blocks", "tables", "strike", "cuddled-lists", "footnotes", "header-ids"])
+            md_fingerprint = file_fingerprint(md_path)
+            if md_fingerprint is not None:
+                # Compiling a large file takes a while: keep it off the gevent hub
+                html_content = run_native(markdown_renderer.render, md_path, md_fingerprint)[1]
             else:
                 html_content = '<p><em>Arquivo markdown não encontrado.</em></p>'
             rendered_pages.append({**page, "html_content": html_content, "font_size": font_size})
         elif page['type'] == 'image':
             image_file = page.get('image_file', '')
-            rendered_pages.append({**page, "image_file": image_file})
+            # A missing variant is resized here: keep that off the gevent hub
+            image_url, image_srcsets = run_native(image_sources, image_file)
+            rendered_pages.append({**page, "image_file": image_file, "image_url": image_url, "image_sources": image_srcsets})
         # Add more types as needed
+    return rendered_pages
+
+def render_carousel(rendered_pages, content_version=''):
+    """Render the full carousel page (the output of carousel_pages()) to an HTML string"""
+    # Load global config
+    global_config = get_global_config()
+    last_update_month = global_config.get('last_update_month', '')
+    company_name = global_config.get('company_name', 'Company Name')
+    language = global_config.get('language', 'pt')
+    number_format = global_config.get('number_format', ' # ###')
+    
+    # Load translations
+    translations = load_translations(language)
+    
+    # Check logo availability
+    logo_info = check_logo_files()
+    
     # Use the template and css_file from the first page (all pages use the same template in carousel)
     template_name = rendered_pages[0].get('template', 'carousel.html') if rendered_pages else 'carousel.html'
     css_link = ''
@@ -584,10 +953,222 @@ def dashboard_carousel():
         css_link = Markup(f'<link rel="stylesheet" href="/static/css/{rendered_pages[0]["css_file"]}">')
     # In the template render, if type is 'text-md', pass html_content and font_size
     if rendered_pages and rendered_pages[0]['type'] == 'text-md':
-        return render_template(template_name, pages=rendered_pages, html_content=rendered_pages[0]['html_content'], font_size=rendered_pages[0]['font_size'], last_update_month=last_update_month, company_name=company_name, language=language, translations=translations, page_type='text-md', logo_info=logo_info, number_format=number_format)
+        return render_template(template_name, pages=rendered_pages, html_content=rendered_pages[0]['html_content'], font_size=rendered_pages[0]['font_size'], last_update_month=last_update_month, company_name=company_name, language=language, translations=translations, page_type='text-md', logo_info=logo_info, number_format=number_format, carousel_version=content_version)
     if rendered_pages and rendered_pages[0]['type'] == 'image':
-        return render_template(template_name, pages=rendered_pages, image_file=rendered_pages[0]['image_file'], last_update_month=last_update_month, company_name=company_name, language=language, translations=translations, page_type='image', logo_info=logo_info, number_format=number_format)
-    return render_template(template_name, pages=rendered_pages, css_link=css_link, last_update_month=last_update_month, company_name=company_name, version=get_version(), translations=translations, language=language, logo_info=logo_info, number_format=number_format)
+        return render_template(template_name, pages=rendered_pages, image_file=rendered_pages[0]['image_file'], last_update_month=last_update_month, company_name=company_name, language=language, translations=translations, page_type='image', logo_info=logo_info, number_format=number_format, carousel_version=content_version)
+    return render_template(template_name, pages=rendered_pages, css_link=css_link, last_update_month=last_update_month, company_name=company_name, version=get_version(), translations=translations, language=language, logo_info=logo_info, number_format=number_format, carousel_version=content_version)
+
+def carousel_version():
+    """Version of every input of the carousel page: configs, data, markdown, i18n, logos, templates"""
+    global_config = get_global_config()
+    language = global_config.get('language', 'pt')
+    pages = get_active_pages()
+    # The global config, translations, VERSION and logos are covered by the site version
+    files = [os.path.join(app.template_folder, 'carousel.html')]
+    for page in pages:
+        files.append(os.path.join(app.template_folder, page.get('template', 'carousel.html')))
+        if page.get('type') == 'text-md':
+            files.append(os.path.join('data', page.get('md_file', '')))
+        elif page.get('type') == 'image':
+            files.append(os.path.join('data', page.get('image_file', '')))
+    snapshots = [(page['id'], widget_engine.version(page)) for page in pages if page['type'] in DATA_PAGE_TYPES]
+    return language, make_etag('carousel', site_state.version, page_registry.version,
+                               [(f, file_fingerprint(f)) for f in files], snapshots)
+
+def carousel_manifest(rendered_pages):
+    """Digests of what the carousel shows, to tell which pages and widgets changed between versions.
+
+    `shell` covers what is rendered around the pages array (global config,
+    translations, logos, the templates and the first page's stylesheet):
+    displays need a full reload when it changes.
+    """
+    first = rendered_pages[0] if rendered_pages else {}
+    templates = sorted({os.path.join(app.template_folder, name)
+                        for name in ('carousel.html', first.get('template', 'carousel.html'))})
+    manifest = {
+        'shell': make_etag(site_state.version, [(f, file_fingerprint(f)) for f in templates],
+                           first.get('template'), first.get('css_file')),
+        'order': [page['id'] for page in rendered_pages],
+        'pages': {}
+    }
+    for page in rendered_pages:
+        manifest['pages'][str(page['id'])] = {
+            'page': make_etag({key: value for key, value in page.items() if key != 'widgets'}),
+            'widgets': [[widget.get('id'), make_etag(widget)] for widget in page.get('widgets') or []]
+        }
+    return manifest
+
+def carousel_changes(old, new, rendered_pages):
+    """Return (changed, removed) between two manifests.
+
+    A page whose widget list kept the same ids only lists the widgets
+    that changed, by index; any other change sends the whole page.
+    """
+    changed = []
+    for page in rendered_pages:
+        before = old['pages'].get(str(page['id']))
+        after = new['pages'][str(page['id'])]
+        if before == after:
+            continue
+        if (before is None or before['page'] != after['page']
+                or [w[0] for w in before['widgets']] != [w[0] for w in after['widgets']]):
+            changed.append({'id': page['id'], 'page': page})
+        else:
+            widgets = [{'index': i, 'widget': page['widgets'][i]}
+                       for i, (b, a) in enumerate(zip(before['widgets'], after['widgets'])) if b != a]
+            changed.append({'id': page['id'], 'widgets': widgets})
+    removed = [page_id for page_id in old['order'] if str(page_id) not in new['pages']]
+    return changed, removed
+
+class RenderedPage:
+    """A rendered HTML page with its pre-compressed variants"""
+
+    def __init__(self, version, html):
+        self.version = version
+        self.etag = version
+        self.body = html.encode('utf-8')
+        self.encoded = {'gzip': gzip.compress(self.body, compresslevel=6)}
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(self.body, quality=9)
+
+    def response(self):
+        if request.if_none_match.contains(self.etag):
+            response = Response(status=304)
+        else:
+            encoding = None
+            for candidate in ('br', 'gzip'):
+                if candidate in self.encoded and request.accept_encodings[candidate]:
+                    encoding = candidate
+                    break
+            body = self.encoded[encoding] if encoding else self.body
+            response = Response(body, mimetype='text/html')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+class CarouselCache:
+    """Rendered carousel HTML, one entry per language, valid for one input version"""
+
+    def __init__(self):
+        self._entries = {}
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._rebuild_pending = False
+        self.builds = 0
+        self.last_build_seconds = None
+
+    def get(self):
+        """Return the RenderedPage for the current inputs, rendering it if needed"""
+        language, version = carousel_version()
+        entry = self._entries.get(language)
+        if entry is not None and entry.version == version:
+            return entry
+        return single_flight.do(('carousel', language, version), lambda: self._build(language, version))
+
+    def pages(self):
+        """Return (version, pages, manifest) for the current inputs"""
+        language, version = carousel_version()
+        return self._pages_at(language, version)
+
+    def _pages_at(self, language, version):
+        entry = self._pages.get(language)
+        if entry is not None and entry[0] == version:
+            return entry
+        return single_flight.do(('carousel-pages', language, version), lambda: self._build_pages(language, version))
+
+    def _build_pages(self, language, version):
+        pages = carousel_pages()
+        manifest = carousel_manifest(pages)
+        # Kept for any worker to diff against when a display asks for changes since this version
+        try:
+            shared_cache.set(f'carousel-manifest:{version}', 'manifest', json.dumps(manifest).encode('utf-8'))
+        except sqlite3.Error as e:
+            app.logger.error(f"Error storing the carousel manifest: {e}")
+        entry = (version, pages, manifest)
+        with self._lock:
+            self._pages[language] = entry
+        return entry
+
+    def manifest(self, version):
+        """The manifest stored for a past version, or None if unknown or evicted"""
+        try:
+            value = shared_cache.get(f'carousel-manifest:{version}', 'manifest')
+        except sqlite3.Error as e:
+            app.logger.error(f"Error reading the carousel manifest: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def _build(self, language, version):
+        started = time.perf_counter()
+        # Rendered by one worker per version, the others reuse its HTML
+        html = shared_cache.get_or_compute(
+            f'carousel:{language}', version,
+            lambda: render_carousel(self._pages_at(language, version)[1], version).encode('utf-8'),
+            serve_stale=False)
+        entry = RenderedPage(version, html.decode('utf-8'))
+        with self._lock:
+            self._entries[language] = entry
+            self.builds += 1
+            self.last_build_seconds = round(time.perf_counter() - started, 4)
+        return entry
+
+    def schedule_rebuild(self, delay=0.5):
+        """Re-render in the background after inputs changed, so displays reloading get a warm page"""
+        with self._lock:
+            if self._rebuild_pending:
+                return
+            self._rebuild_pending = True
+
+        def rebuild():
+            time.sleep(delay)
+            with self._lock:
+                self._rebuild_pending = False
+            try:
+                with app.test_request_context('/'):
+                    self.get()
+            except Exception as e:
+                app.logger.error(f"Error pre-rendering carousel: {e}")
+
+        threading.Thread(target=rebuild, name='carousel-rebuild', daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'builds': self.builds,
+                'last_build_seconds': self.last_build_seconds
+            }
+
+carousel_cache = CarouselCache()
+
+@app.route('/')
+def dashboard_carousel():
+    return carousel_cache.get().response()
+
+@app.route('/api/carousel/changes')
+def get_carousel_changes():
+    """What changed in the carousel since the version a display was rendered with.
+
+    Displays call this on config_changed/data_changed events and patch
+    their pages in place; `reload` asks for a full reload instead (the
+    version is unknown or something outside the pages array changed).
+    """
+    since = request.args.get('since', '')
+    version, pages, manifest = carousel_cache.pages()
+    if since == version:
+        old = manifest
+    else:
+        old = carousel_cache.manifest(since) if since else None
+        if old is None or old['shell'] != manifest['shell']:
+            return jsonify({'version': version, 'reload': True})
+    changed, removed = carousel_changes(old, manifest, pages)
+    response = jsonify({'version': version, 'reload': False, 'order': manifest['order'],
+                        'changed': changed, 'removed': removed})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @app.route('/dashboard')
 def dashboard():
@@ -626,47 +1207,35 @@ def admin():
 def api_pages():
     """API endpoint to get all pages"""
     pages = get_pages()
-    return jsonify({'pages': pages})
+    return conditional_response(make_etag('pages', page_registry.version),
+                                lambda: jsonify({'pages': pages}))
+
+def apply_page_changes(changes):
+    """Apply a batch of page changes as one transaction.
+
+    Returns (updated_folders, config_version). A single config_changed event
+    is published for the whole batch.
+    """
+    with pages_lock():
+        updated = commit_page_changes(changes, 'pages')
+    page_registry.invalidate(updated)
+    page_registry.pages()
+    if updated:
+        publish_change('config_changed', pages=updated, config_version=page_registry.version)
+    return updated, page_registry.version
 
 @app.route('/api/pages/<int:page_id>/toggle', methods=['POST'])
 def toggle_page(page_id):
     """Toggle page active/inactive status in config.json file"""
     # Find the page by ID
-    pages = get_pages()
-    target_page = None
-    
-    for page in pages:
-        if page['id'] == page_id:
-            target_page = page
-            break
-    
+    target_page = page_registry.page_by_seq_id(page_id)
     if not target_page:
         return jsonify({'success': False, 'message': 'Página não encontrada'}), 404
     
-    # Get the page directory from the config
-    page_dir = target_page['config'].get('_dir')
-    if not page_dir:
-        return jsonify({'success': False, 'message': 'Erro: diretório da página não encontrado'}), 500
-    
-    config_file = os.path.join('pages', page_dir, 'config.json')
-    
     try:
-        # Read current config
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        
-        # Toggle active status
-        current_active = config.get('active', True)
-        config['active'] = not current_active
-        
-        # Write back to file
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        
-        # Broadcast update to all connected clients
-        # Note: In a production environment, you might want to use Redis or a message queue
-        # for broadcasting to multiple server instances
-        app.logger.info(f"Configuration changed for page {target_page['id']}, clients should refresh")
+        active = not target_page['config'].get('active', True)
+        _, config_version = apply_page_changes({target_page['page_id']: {'active': active}})
+        app.logger.info(f"Configuration changed for page {target_page['page_id']}, clients should refresh")
         
         return jsonify({
             'success': True,
@@ -674,8 +1243,9 @@ def toggle_page(page_id):
             'page': {
                 'id': page_id,
                 'page_id': target_page['id'],
-                'active': config['active']
-            }
+                'active': active
+            },
+            'config_version': config_version
         })
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao atualizar configuração: {str(e)}'}), 500
@@ -688,312 +1258,110 @@ def reorder_pages():
         if not data or 'order' not in data:
             return jsonify({'success': False, 'message': 'Dados inválidos'}), 400
         
-        order = data['order']
-        
-        # Get current pages to map IDs to directories
-        pages = get_pages()
-        id_to_dir = {}
-        
-        for page in pages:
-            id_to_dir[page['page_id']] = page['config'].get('_dir')  # Use page_id instead of sequential id
-        
-        # Update order in each config file
-        for i, page_id in enumerate(order):
-            page_dir = id_to_dir.get(page_id)
-            if page_dir:
-                config_file = os.path.join('pages', page_dir, 'config.json')
-                
-                try:
-                    with open(config_file, 'r', encoding='utf-8') as f:
-                        config = json.load(f)
-                    
-                    config['order'] = i + 1
-                    
-                    with open(config_file, 'w', encoding='utf-8') as f:
-                        json.dump(config, f, indent=2, ensure_ascii=False)
-                        
-                except Exception as e:
-                    app.logger.error(f"Error updating order for {page_dir}: {e}")
-        
-        return jsonify({'success': True, 'message': 'Páginas reordenadas com sucesso'})
+        # Ignore ids that no longer exist, as before
+        known = {page['page_id'] for page in get_pages()}
+        changes = {page_id: {'order': i + 1} for i, page_id in enumerate(data['order']) if page_id in known}
+        _, config_version = apply_page_changes(changes)
+        return jsonify({'success': True, 'message': 'Páginas reordenadas com sucesso', 'config_version': config_version})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao reordenar: {str(e)}'}), 500
 
+@app.route('/api/pages/batch', methods=['POST'])
+def batch_update_pages():
+    """Apply order/active/config changes to several pages in one transaction"""
+    data = request.get_json(silent=True)
+    changes = data.get('changes') if isinstance(data, dict) else None
+    if not isinstance(changes, dict) or not all(isinstance(c, dict) for c in changes.values()):
+        return jsonify({'success': False, 'message': 'Dados inválidos'}), 400
+    try:
+        updated, config_version = apply_page_changes(changes)
+    except KeyError as e:
+        # str() of a KeyError is the repr of its message
+        return jsonify({'success': False, 'message': e.args[0]}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro ao atualizar páginas: {str(e)}'}), 500
+    return jsonify({'success': True, 'updated': updated, 'config_version': config_version})
+
 @app.route('/api/data')
 def get_all_data():
     """API endpoint to get all dashboard data (modular, per-page, per-widget)"""
-    try:
-        pages_data = []
-        for page in get_active_pages():
-            page_widgets = []
-            if page['type'] in ('3x2', '2x2', '2x1-graph'):
-                xlsx_path = os.path.join('data', page['xlsx_file'])
-                if not os.path.exists(xlsx_path):
-                    continue
-                wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-                for widget_cfg in page['widgets']:
-                    if not widget_cfg.get('active', True):
-                        continue
-                    sheet = wb[widget_cfg['sheet']]
-                    
-                    # Get header row to find column indices
-                    headers = list(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True)))
-                    
-                    # Use configurable column names with fallbacks
-                    column_month = widget_cfg.get('column_month', 'Mês')
-                    column_total = widget_cfg.get('column_total', 'Total')
-                    column_target = widget_cfg.get('column_target', 'Meta')
-                    
-                    # Find column indices
-                    idx_month = headers.index(column_month) if column_month in headers else 0
-                    idx_total = headers.index(column_total) if column_total in headers else 1
-                    idx_target = headers.index(column_target) if column_target in headers else 2
-                    
-                    months, totals, targets = [], [], []
-                    for row in sheet.iter_rows(min_row=2, values_only=True):
-                        # Only require total to be present, target can be None
-                        if row[idx_total] is not None:
-                            months.append(row[idx_month])
-                            totals.append(row[idx_total])
-                            # Handle missing target values gracefully
-                            target_value = row[idx_target] if idx_target is not None and idx_target < len(row) else None
-                            targets.append(target_value)
-                    if len(totals) >= 2:
-                        value = totals[-1]
-                        target = targets[-1]
-                        prev = totals[-2]
-                        curr = totals[-1]
-                        if prev is not None and curr is not None and prev != 0:
-                            percent_change = ((curr - prev) / prev) * 100
-                            if percent_change > 0:
-                                trend = '▲'
-                                trend_color = 'green'
-                            elif percent_change < 0:
-                                trend = '▼'
-                                trend_color = 'red'
-                            else:
-                                trend = '→'
-                                trend_color = 'gray'
-                        else:
-                            percent_change = 0
-                            trend = ''
-                            trend_color = 'gray'
-                    else:
-                        value = totals[-1] if totals else 0
-                        target = targets[-1] if targets else 0
-                        percent_change = 0
-                        trend = ''
-                        trend_color = 'gray'
-                    value_color = "#fa6238"
-                    value_num = safe_float(value)
-                    target_num = safe_float(target)
-                    if value_num is not None and target_num is not None:
-                        if value_num >= target_num:
-                            value_color = "#0bda5b"
-                    page_widgets.append({
-                        "id": widget_cfg['id'],
-                        "name": widget_cfg['name'],
-                        "value": value,
-                        "target": target,
-                        "percent_change": round(percent_change, 1),
-                        "trend": trend,
-                        "trend_color": trend_color,
-                        "labels": months,
-                        "chart_data": totals,
-                        "value_color": value_color
-                    })
-            pages_data.append({
-                "id": page['id'],
-                "widgets": page_widgets
-            })
-        global_config = get_global_config()
-        data = {
-            "pages": pages_data,
-            "metadata": {
-                "last_update": datetime.now().isoformat(),
-                "company": global_config.get('company_name', 'Company Name'),
-                "version": get_version()
+    pages = [page for page in get_active_pages()
+             if not page_data_file(page) or file_fingerprint(page_data_file(page))]
+    etag = make_etag('data', pages_data_version(pages), site_state.version)
+
+    def build():
+        try:
+            pages_data = []
+            data_mtimes = []
+            for page in pages:
+                snapshot = widget_engine.snapshot(page)
+                pages_data.append({
+                    "id": page['id'],
+                    "widgets": snapshot.widgets
+                })
+                if snapshot.data_fingerprint:
+                    data_mtimes.append(snapshot.data_fingerprint[0])
+            # Last modification of the data files the served snapshots were built from
+            last_update = datetime.fromtimestamp(max(data_mtimes) / 1e9) if data_mtimes else datetime.now()
+            global_config = get_global_config()
+            data = {
+                "pages": pages_data,
+                "metadata": {
+                    "last_update": last_update.isoformat(),
+                    "company": global_config.get('company_name', 'Company Name'),
+                    "version": get_version()
+                }
             }
-        }
-        return jsonify(data)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+            return jsonify(data)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return conditional_response(etag, build, DATA_CACHE_CONTROL)
+
+def _active_data_page(page_id):
+    """Return the active page with its data file present, or abort with 404"""
+    page = page_registry.active_page(page_id)
+    if not page:
+        abort(404)
+    data_path = page_data_file(page)
+    if data_path and file_fingerprint(data_path) is None:
+        abort(404)
+    return page
 
 @app.route('/api/data/<page_id>')
 def get_page_data(page_id):
     """API endpoint to get data for a specific page"""
-    try:
-        page = None
-        for p in get_active_pages():
-            if p['id'] == page_id:
-                page = p
-                break
-        if not page:
-            return abort(404)
-        page_widgets = []
-        if page['type'] in ('3x2', '2x2', '2x1-graph'):
-            xlsx_path = os.path.join('data', page['xlsx_file'])
-            if not os.path.exists(xlsx_path):
-                return abort(404)
-            wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-            for widget_cfg in page['widgets']:
-                if not widget_cfg.get('active', True):
-                    continue
-                sheet = wb[widget_cfg['sheet']]
-                
-                # Get header row to find column indices
-                headers = list(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True)))
-                
-                # Use configurable column names with fallbacks
-                column_month = widget_cfg.get('column_month', 'Mês')
-                column_total = widget_cfg.get('column_total', 'Total')
-                column_target = widget_cfg.get('column_target', 'Meta')
-                
-                # Find column indices
-                idx_month = headers.index(column_month) if column_month in headers else 0
-                idx_total = headers.index(column_total) if column_total in headers else 1
-                idx_target = headers.index(column_target) if column_target in headers else 2
-                
-                months, totals, targets = [], [], []
-                for row in sheet.iter_rows(min_row=2, values_only=True):
-                    # Only require total to be present, target can be None
-                    if row[idx_total] is not None:
-                        months.append(row[idx_month])
-                        totals.append(row[idx_total])
-                        # Handle missing target values gracefully
-                        target_value = row[idx_target] if idx_target is not None and idx_target < len(row) else None
-                        targets.append(target_value)
-                if len(totals) >= 2:
-                    value = totals[-1]
-                    target = targets[-1]
-                    prev = totals[-2]
-                    curr = totals[-1]
-                    if prev is not None and curr is not None and prev != 0:
-                        percent_change = ((curr - prev) / prev) * 100
-                        if percent_change > 0:
-                            trend = '▲'
-                            trend_color = 'green'
-                        elif percent_change < 0:
-                            trend = '▼'
-                            trend_color = 'red'
-                        else:
-                            trend = '→'
-                            trend_color = 'gray'
-                    else:
-                        percent_change = 0
-                        trend = ''
-                        trend_color = 'gray'
-                else:
-                    value = totals[-1] if totals else 0
-                    target = targets[-1] if targets else 0
-                    percent_change = 0
-                    trend = ''
-                    trend_color = 'gray'
-                value_color = "#fa6238"
-                value_num = safe_float(value)
-                target_num = safe_float(target)
-                if value_num is not None and target_num is not None:
-                    if value_num >= target_num:
-                        value_color = "#0bda5b"
-                page_widgets.append({
-                    "id": widget_cfg['id'],
-                    "name": widget_cfg['name'],
-                    "value": value,
-                    "target": target,
-                    "percent_change": round(percent_change, 1),
-                    "trend": trend,
-                    "trend_color": trend_color,
-                    "labels": months,
-                    "chart_data": totals,
-                    "value_color": value_color
-                })
-        return jsonify({"id": page['id'], "widgets": page_widgets})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    page = _active_data_page(page_id)
+
+    def build():
+        try:
+            page_widgets = widget_engine.widgets(page)
+            return jsonify({"id": page['id'], "widgets": page_widgets})
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return conditional_response(make_etag('page', pages_data_version([page])), build, DATA_CACHE_CONTROL)
 
 @app.route('/api/data/<page_id>/<widget_id>')
 def get_widget_data(page_id, widget_id):
     """API endpoint to get data for a specific widget"""
-    try:
-        page = None
-        for p in get_active_pages():
-            if p['id'] == page_id:
-                page = p
-                break
-        if not page:
-            return abort(404)
-        if page['type'] in ('3x2', '2x2', '2x1-graph'):
-            xlsx_path = os.path.join('data', page['xlsx_file'])
-            if not os.path.exists(xlsx_path):
-                return abort(404)
-            wb = openpyxl.load_workbook(xlsx_path, data_only=True)
-            for widget_cfg in page['widgets']:
-                if widget_cfg['id'] != widget_id or not widget_cfg.get('active', True):
-                    continue
-                sheet = wb[widget_cfg['sheet']]
-                
-                # Get header row to find column indices
-                headers = list(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True)))
-                
-                # Use configurable column names with fallbacks
-                column_month = widget_cfg.get('column_month', 'Mês')
-                column_total = widget_cfg.get('column_total', 'Total')
-                column_target = widget_cfg.get('column_target', 'Meta')
-                
-                # Find column indices
-                idx_month = headers.index(column_month) if column_month in headers else 0
-                idx_total = headers.index(column_total) if column_total in headers else 1
-                idx_target = headers.index(column_target) if column_target in headers else 2
-                
-                months, totals, targets = [], [], []
-                for row in sheet.iter_rows(min_row=2, values_only=True):
-                    if row[idx_total] is not None and row[idx_target] is not None:
-                        months.append(row[idx_month])
-                        totals.append(row[idx_total])
-                        targets.append(row[idx_target])
-                if len(totals) >= 2:
-                    value = totals[-1]
-                    target = targets[-1]
-                    prev = totals[-2]
-                    curr = totals[-1]
-                    if prev is not None and curr is not None and prev != 0:
-                        percent_change = ((curr - prev) / prev) * 100
-                        if percent_change > 0:
-                            trend = '▲'
-                            trend_color = 'green'
-                        elif percent_change < 0:
-                            trend = '▼'
-                            trend_color = 'red'
-                        else:
-                            trend = '→'
-                            trend_color = 'gray'
-                    else:
-                        percent_change = 0
-                        trend = ''
-                        trend_color = 'gray'
-                else:
-                    value = totals[-1] if totals else 0
-                    target = targets[-1] if targets else 0
-                    percent_change = 0
-                    trend = ''
-                    trend_color = 'gray'
-                value_color = "#0bda5b" if value >= target else "#fa6238"
-                widget_data = {
-                    "id": widget_cfg['id'],
-                    "name": widget_cfg['name'],
-                    "value": value,
-                    "target": target,
-                    "percent_change": round(percent_change, 1),
-                    "trend": trend,
-                    "trend_color": trend_color,
-                    "labels": months,
-                    "chart_data": totals,
-                    "value_color": value_color
-                }
-                return jsonify(widget_data)
-        return abort(404)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    page = _active_data_page(page_id)
+    if page_data_file(page) is None:
+        abort(404)
+
+    def build():
+        try:
+            widget_data = widget_engine.widget(page, widget_id)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        if widget_data is None:
+            abort(404)
+        return jsonify(widget_data)
+
+    etag = make_etag('widget', widget_id, pages_data_version([page]))
+    return conditional_response(etag, build, DATA_CACHE_CONTROL)
 
 @app.route('/pages/<page_id>/<template>')
 def serve_page_template(page_id, template):
@@ -1011,20 +1379,84 @@ def serve_data_file(filename):
     """Serve files from the /data directory (for images, markdown, etc.)"""
     return send_from_directory('data', filename)
 
+@app.route('/media/<name>')
+def serve_image_variant(name):
+    """Serve a display variant of a data image; names are content hashes, so they never change"""
+    path = image_variants.file_path(name)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = send_from_directory(image_variants.cache_dir, name, max_age=365 * 24 * 3600)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+WARMUP = os.environ.get('WARMUP', '0').lower() in ('1', 'true', 'yes')
+# off (WARMUP not set), cold, warming or ready
+warmup_state = {'status': 'cold' if WARMUP else 'off', 'pages': 0, 'seconds': None}
+
+def warm_up(progress=None):
+    """Build every active page's data and render the carousel before taking traffic.
+
+    Runs synchronously in the calling thread, so gunicorn can call it in
+    the master before forking (GUNICORN_PRELOAD) or in a worker before it
+    accepts connections. Pages that fail are logged and left cold.
+    progress() is called after each page and after the carousel render; a
+    worker passes its heartbeat so gunicorn does not time it out meanwhile.
+    """
+    warmup_state['status'] = 'warming'
+    started = time.perf_counter()
+    pages = get_active_pages()
+    widget_engine.warm([page for page in pages if page['type'] in DATA_PAGE_TYPES], progress)
+    try:
+        # Also prepares the markdown and image variants the carousel shows
+        with app.test_request_context('/'):
+            carousel_cache.get()
+    except Exception as e:
+        app.logger.error(f"Error rendering the carousel during warm-up: {e}")
+    if progress is not None:
+        progress()
+    seconds = round(time.perf_counter() - started, 4)
+    warmup_state.update(status='ready', pages=len(pages), seconds=seconds)
+    startup_timings['warm-up'] = seconds
+    app.logger.info(f"Warm-up of {len(pages)} pages done in {seconds:.3f}s")
+
+def close_connections():
+    """Close this process's long-lived SQLite connections (before forking workers)"""
+    snapshot_store.close()
+    shared_cache.close()
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
+    # Load balancers and the Docker healthcheck only route to warm workers
+    warming = warmup_state['status'] in ('cold', 'warming')
     return jsonify({
-        'status': 'healthy',
+        'status': 'warming' if warming else 'healthy',
+        'warmup': warmup_state,
         'timestamp': datetime.now().isoformat(),
         'version': get_version(),
         'database': 'connected',
-        'data_files': 'loaded'
-    })
+        'data_files': 'loaded',
+        'workbook_cache': workbook_cache.stats(),
+        'event_stream': event_broker.stats(),
+        'fs_watcher': fs_watcher.backend if fs_watcher.running else 'off',
+        'carousel_cache': carousel_cache.stats(),
+        'data_snapshots': widget_engine.stats(),
+        'shared_cache': shared_cache.stats(),
+        'single_flight': single_flight.stats(),
+        'image_variants': image_variants.stats(),
+        'markdown_renders': markdown_renderer.stats(),
+        'site': site_state.stats(),
+        'startup': startup_timings
+    }), 503 if warming else 200
 
 @app.route('/api/config')
 def get_config():
     """Get system configuration"""
+    etag = make_etag('config', site_state.version)
+    return conditional_response(etag, build_config_response)
+
+def build_config_response():
     global_config = get_global_config()
     logo_info = check_logo_files()
     
@@ -1051,56 +1483,182 @@ def update_global_config():
         return jsonify({'success': False, 'message': 'No data provided'}), 400
     allowed_keys = {'company_name', 'last_update_month', 'language', 'dashboard_types'}
     config_path = os.path.join('pages', 'config.json')
-    config = get_global_config()
-    updated = False
-    for key in allowed_keys:
-        if key in data:
-            config[key] = data[key]
-            updated = True
-    if not updated:
+    if not any(key in data for key in allowed_keys):
         return jsonify({'success': False, 'message': 'No valid fields to update'}), 400
     try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
+        with pages_lock():
+            # Another worker may have written it since this one last looked
+            site_state.refresh(force=True)
+            config = get_global_config()
+            for key in allowed_keys:
+                if key in data:
+                    config[key] = data[key]
+            write_json_atomic(config_path, config)
+        forget_fingerprints([config_path])
+        site_state.refresh(force=True)
+        publish_change('config_changed')
         return jsonify({'success': True, 'message': 'Config updated successfully', 'config': config})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error updating config: {str(e)}'}), 500
 
 # Server-Sent Events for real-time updates
+SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS', '1000'))
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', '32'))
+SSE_HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', '30'))
+
+event_broker = EventBroker(SSE_MAX_CLIENTS, SSE_QUEUE_SIZE)
+
+EVENT_BUS_POLL_INTERVAL = float(os.environ.get('EVENT_BUS_POLL_INTERVAL', '1'))
+EVENT_BUS_RETENTION = int(os.environ.get('EVENT_BUS_RETENTION', '600'))
+
+event_bus = EventBus(DB_PATH, event_broker, EVENT_BUS_POLL_INTERVAL, EVENT_BUS_RETENTION)
+
+# --- Filesystem watcher ---
+FS_WATCHER = os.environ.get('FS_WATCHER', 'auto').lower()
+FS_WATCHER_DEBOUNCE = float(os.environ.get('FS_WATCHER_DEBOUNCE', '2'))
+FS_WATCHER_POLL_INTERVAL = float(os.environ.get('FS_WATCHER_POLL_INTERVAL', '2'))
+
+fs_watcher = FileWatcher(['pages', 'data'], FS_WATCHER, FS_WATCHER_DEBOUNCE, FS_WATCHER_POLL_INTERVAL)
+
+def handle_fs_changes(paths):
+    """Invalidate caches touched by out-of-band edits and tell this worker's displays.
+
+    paths is None when the watcher lost events (inotify queue overflow):
+    every remembered fingerprint and page config is dropped instead.
+    """
+    if paths is None:
+        forget_fingerprints()
+        page_registry.invalidate()
+        site_state.refresh(force=True)
+        widget_engine.refresh_all()
+        carousel_cache.schedule_rebuild()
+        app.logger.warning("Filesystem changes lost, invalidated all cached files")
+        event_broker.publish({'type': 'config_changed', 'source': 'watcher', 'pages': [], 'files': [],
+                              'timestamp': datetime.now().isoformat()})
+        return
+    pages_root = os.path.abspath('pages') + os.sep
+    data_root = os.path.abspath('data') + os.sep
+    # Page folder names, or 'config.json' for the global config
+    config_dirs = sorted({os.path.relpath(p, pages_root).split(os.sep)[0] for p in paths if p.startswith(pages_root)})
+    data_files = sorted({os.path.relpath(p, data_root) for p in paths if p.startswith(data_root)})
+    forget_fingerprints(paths)
+    page_registry.invalidate([d for d in config_dirs if d != 'config.json'])
+    # Changed workbooks are re-parsed through their new fingerprint; only deleted ones are dropped
+    for name in data_files:
+        if file_fingerprint(os.path.join('data', name)) is None:
+            workbook_cache.invalidate(os.path.join('data', name))
+    widget_engine.refresh_all()
+    carousel_cache.schedule_rebuild()
+    app.logger.info(f"Filesystem changes detected: pages={config_dirs} data={data_files}")
+
+    # Every worker runs its own watcher, so events only go to local clients,
+    # and changes already announced through the API are not repeated.
+    if config_dirs and not event_broker.published_recently('config_changed'):
+        event_broker.publish({'type': 'config_changed', 'source': 'watcher', 'pages': config_dirs,
+                              'files': data_files, 'timestamp': datetime.now().isoformat()})
+        return
+    data_files = [name for name in data_files if not event_broker.published_recently('data_changed', name)]
+    if data_files:
+        event = {'type': 'data_changed', 'source': 'watcher', 'files': data_files,
+                 'timestamp': datetime.now().isoformat()}
+        if len(data_files) == 1:
+            event['file'] = data_files[0]
+        event_broker.publish(event)
+
+fs_watcher.subscribe(handle_fs_changes)
+
+def handle_data_refreshed(page_ids):
+    """A background rebuild changed some widget payloads: re-render and tell this worker's displays"""
+    carousel_cache.schedule_rebuild()
+    event_broker.publish({'type': 'data_changed', 'source': 'refresh', 'pages': page_ids,
+                          'timestamp': datetime.now().isoformat()})
+
+widget_engine.subscribe(handle_data_refreshed)
+
+@app.before_request
+def start_background_services():
+    global _fingerprint_cache_enabled
+    fs_watcher.start()
+    _fingerprint_cache_enabled = fs_watcher.running
+    widget_engine.start()
+
+def publish_change(event_type, **data):
+    """Announce a change made through the API and pre-render the carousel for it"""
+    widget_engine.refresh_all()
+    carousel_cache.schedule_rebuild()
+    return event_bus.publish(event_type, **data)
+
+def format_sse(event):
+    if 'id' in event:
+        return f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+    return f"data: {json.dumps(event)}\n\n"
+
 @app.route('/api/events')
 def sse_events():
     """Server-Sent Events endpoint for real-time dashboard updates"""
+    client = event_broker.subscribe()
+    if client is None:
+        app.logger.warning("SSE client limit reached, rejecting connection")
+        return Response('Too many event stream clients', status=503, headers={'Retry-After': '30'})
+    event_bus.start()
+
+    # Replay events missed while a reconnecting client was away
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    missed = event_bus.since(int(last_event_id)) if last_event_id.isdigit() else []
+
     def generate():
-        while True:
-            # Send a heartbeat every 30 seconds to keep connection alive
-            yield f"data: {json.dumps({'type': 'heartbeat', 'timestamp': datetime.now().isoformat()})}\n\n"
-            time.sleep(30)
-    
-    return Response(generate(), mimetype='text/event-stream')
+        last_sent = int(last_event_id) if last_event_id.isdigit() else 0
+        try:
+            # Tell the browser how long to wait before reconnecting
+            yield "retry: 5000\n\n"
+            for event in missed:
+                last_sent = event['id']
+                yield format_sse(event)
+            while True:
+                try:
+                    event = client.get(timeout=SSE_HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    # Send a heartbeat to keep the connection alive
+                    event = {'type': 'heartbeat', 'timestamp': datetime.now().isoformat()}
+                if event.get('id') is not None:
+                    if event['id'] <= last_sent:
+                        continue
+                    last_sent = event['id']
+                yield format_sse(event)
+        finally:
+            event_broker.unsubscribe(client)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/api/broadcast-update')
 def broadcast_update():
     """Endpoint to trigger update broadcast to all connected clients"""
-    # This would be called when config files change
-    # For now, we'll use a simple approach with SSE
+    publish_change('config_changed', reason='manual')
     return jsonify({'success': True, 'message': 'Update broadcast triggered'})
 
 @app.route('/api/version')
 def get_app_version():
     """Get application version information"""
-    return jsonify(get_version_info())
+    etag = make_etag('version', site_state.version)
+    return conditional_response(etag, lambda: jsonify(get_version_info()), 'public, max-age=60, must-revalidate')
 
 @app.route('/api/pages/resolve-orders', methods=['POST'])
 def resolve_page_orders():
     """Manually trigger order resolution for all pages"""
     try:
-        conn = sqlite3.connect('dashboard.db')
+        conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
         # Resolve duplicate orders
         resolve_duplicate_orders(cursor)
         conn.commit()
         conn.close()
+        with pages_lock():
+            updated = normalize_page_orders('pages')
+        page_registry.invalidate(updated)
         
         return jsonify({
             'success': True, 
@@ -1113,40 +1671,259 @@ def resolve_page_orders():
             'message': f'Error during order resolution: {str(e)}'
         }), 500
 
-ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv', 'jpg', 'png', 'jpeg', 'txt', 'md'}
+ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv', 'parquet', 'jpg', 'png', 'jpeg', 'txt', 'md'}
 DATA_FOLDER = os.path.join(os.getcwd(), 'data')
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def referenced_sheets(filename):
+    """Return [(page_id, sheet, [(column_name, default_index), ...], explicit_names)] for pages using filename.
+
+    explicit_names are the column headers the page sets through `column_*` settings.
+    """
+    references = []
+    for page in page_registry.pages():
+        config = page['config']
+        data_path = page_data_file(config)
+        if not data_path or os.path.basename(data_path) != filename:
+            continue
+        explicit = {value for cfg in [config] + config.get('widgets', [])
+                    for key, value in cfg.items() if key.startswith('column_')}
+        for sheet_name, specs in page_sheet_columns(config).items():
+            references.append((config['id'], sheet_name, specs, explicit))
+    return references
+
+def ingest_workbook(path, filename):
+    """Extract the sheets the pages use from an uploaded workbook and check their headers.
+
+    Returns ({sheet: SheetColumns}, {sheet: [problems]}). A missing header is
+    a problem when the page names it explicitly or there is no column to
+    fall back to. Raises InvalidWorkbookError if the file cannot be opened
+    as a workbook at all.
+    """
+    problems = {}
+    references = referenced_sheets(filename)
+    wb = workbook_cache.open_workbook(path)
+    try:
+        sheets = workbook_cache.ingest(os.path.join(DATA_FOLDER, filename), wb,
+                                       list(dict.fromkeys(sheet_name for _, sheet_name, _, _ in references)))
+        for page_id, sheet_name, specs, explicit in references:
+            messages = problems.setdefault(sheet_name, [])
+            if sheet_name not in sheets:
+                messages.append(f"Page {page_id}: worksheet {sheet_name} does not exist")
+                continue
+            headers = sheets[sheet_name].headers
+            for name, default in dict.fromkeys(specs):
+                if name in headers:
+                    continue
+                if name in explicit:
+                    messages.append(f"Page {page_id}: column '{name}' not found")
+                elif default is not None and default >= len(headers):
+                    messages.append(f"Page {page_id}: column '{name}' not found and the sheet has no column {default + 1}")
+    finally:
+        wb.close()
+    return sheets, {sheet: messages for sheet, messages in problems.items() if messages}
+
+UPLOAD_PREFIX = '.upload-'
+
+class UploadRequest(Request):
+    """Streams files posted to the upload route into hidden files in data/.
+
+    Werkzeug writes each multipart file part to the stream returned here as
+    it arrives, so an upload lands on disk in chunks, on the same filesystem
+    as its destination, and is later moved into place with a rename.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint != 'upload_data_file':
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        os.makedirs(DATA_FOLDER, exist_ok=True)
+        # Keep the extension: openpyxl refuses files without a workbook one
+        suffix = '-' + (secure_filename(filename or '') or 'file')
+        return tempfile.NamedTemporaryFile('wb+', prefix=UPLOAD_PREFIX, suffix=suffix, dir=DATA_FOLDER, delete=False)
+
+app.request_class = UploadRequest
+
+def remove_stale_uploads(max_age=3600):
+    """Delete temporary upload files left behind by interrupted requests"""
+    now = time.time()
+    for name in os.listdir(DATA_FOLDER):
+        if not name.startswith(UPLOAD_PREFIX):
+            continue
+        path = os.path.join(DATA_FOLDER, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except FileNotFoundError:
+            # Another worker cleaned it up (or its upload finished) first
+            continue
+
+class JobStore:
+    """Background job status in the `jobs` table, readable from every worker"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        return conn
+
+    def create(self, job_type, result):
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT INTO jobs (id, job_type, status, result) VALUES (?, ?, 'queued', ?)",
+                             (job_id, job_type, json.dumps(result)))
+                conn.execute("DELETE FROM jobs WHERE created_at < datetime('now', '-1 day')")
+        finally:
+            conn.close()
+        return job_id
+
+    def update(self, job_id, status, result):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE jobs SET status = ?, result = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                             (status, json.dumps(result), job_id))
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT id, job_type, status, result, created_at, updated_at FROM jobs WHERE id = ?",
+                               (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {'id': row[0], 'type': row[1], 'status': row[2], 'result': json.loads(row[3] or 'null'),
+                'created_at': row[4], 'updated_at': row[5]}
+
+job_store = JobStore(DB_PATH)
+# One post-processing thread per worker: uploads are handled in arrival order.
+# Parsing, resizing and rendering go through run_native so gevent workers stay responsive.
+upload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload')
+
+def process_upload(job_id, staged):
+    """Validate, precompute and move uploaded files into place (runs in the background)"""
+    files = [{'filename': filename, 'status': 'pending'} for filename, _ in staged]
+    job_store.update(job_id, 'running', {'files': files})
+    for entry, (filename, tmp_path) in zip(files, staged):
+        file_path = os.path.join(DATA_FOLDER, filename)
+        try:
+            sheets = None
+            if filename.lower().endswith('.xlsx'):
+                try:
+                    sheets, problems = run_native(ingest_workbook, tmp_path, filename)
+                except InvalidWorkbookError as e:
+                    # Keep the current file rather than replacing it with one no page can read
+                    os.remove(tmp_path)
+                    entry.update(status='rejected', error=f'Invalid workbook: {e}')
+                    continue
+                if problems:
+                    entry['validation'] = problems
+            os.replace(tmp_path, file_path)
+            forget_fingerprints([file_path])
+            if sheets:
+                fingerprint = file_fingerprint(file_path)
+                # This worker reads the new version from memory, the others from the sidecar
+                workbook_cache.store(file_path, fingerprint, sheets)
+                try:
+                    run_native(sidecars.write, file_path, fingerprint, sheets)
+                except Exception as e:
+                    app.logger.error(f"Error writing sidecar for {filename}: {e}")
+            try:
+                if is_image(filename):
+                    # Resize now rather than when the carousel first shows it
+                    run_native(image_sources, filename)
+                    prune_image_variants()
+                elif is_markdown(filename):
+                    # Compile once here; text-md pages then only look the HTML up
+                    run_native(markdown_renderer.render, file_path, file_fingerprint(file_path))
+                    prune_markdown_renders()
+            except Exception as e:
+                app.logger.error(f"Error preparing {filename} for display: {e}")
+            publish_change('data_changed', file=filename)
+            entry['status'] = 'saved'
+        except Exception as e:
+            app.logger.error(f"Error processing uploaded file {filename}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            entry.update(status='failed', error=str(e))
+        finally:
+            job_store.update(job_id, 'running', {'files': files})
+    status = 'done' if all(entry['status'] == 'saved' for entry in files) else 'failed'
+    job_store.update(job_id, status, {'files': files})
+    app.logger.info(f"Upload job {job_id} {status}: {[(e['filename'], e['status']) for e in files]}")
+
+@app.errorhandler(413)
+def request_too_large(e):
+    limit = app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024)
+    return jsonify({'success': False, 'message': f'Request too large (limit: {limit:g} MB)'}), 413
+
 @app.route('/api/data/upload', methods=['POST'])
 def upload_data_file():
+    """Receive data files and queue their processing; poll /api/jobs/<job_id> for the outcome"""
+    remove_stale_uploads()
     if 'file' not in request.files:
         return jsonify({'success': False, 'message': 'No file part'}), 400
     files = request.files.getlist('file')
     if not files or all(f.filename == '' for f in files):
         return jsonify({'success': False, 'message': 'No selected file'}), 400
-    uploaded = []
+    staged = []
     errors = []
     for file in files:
+        tmp_path = getattr(file.stream, 'name', None)
         if file and file.filename and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            try:
-                file.save(os.path.join(DATA_FOLDER, filename))
-                uploaded.append(filename)
-            except Exception as e:
-                errors.append({'filename': file.filename, 'error': str(e)})
+            file.stream.flush()
+            size = os.path.getsize(tmp_path)
+            if size > MAX_UPLOAD_FILE_SIZE:
+                errors.append({'filename': file.filename,
+                               'error': f'File too large (limit: {MAX_UPLOAD_FILE_SIZE / (1024 * 1024):g} MB)'})
+            else:
+                file.stream.close()
+                staged.append((filename, tmp_path))
+                continue
         else:
             errors.append({'filename': getattr(file, 'filename', 'unknown'), 'error': 'File type not allowed or missing filename'})
-    if uploaded:
-        return jsonify({'success': True, 'message': 'Files uploaded', 'filenames': uploaded, 'errors': errors})
-    else:
+        file.stream.close()
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if not staged:
         return jsonify({'success': False, 'message': 'No files uploaded', 'errors': errors}), 400
+    filenames = [filename for filename, _ in staged]
+    job_id = job_store.create('upload', {'files': [{'filename': name, 'status': 'pending'} for name in filenames]})
+    upload_executor.submit(process_upload, job_id, staged)
+    return jsonify({'success': True, 'message': 'Files received', 'filenames': filenames, 'errors': errors,
+                    'job_id': job_id, 'status_url': url_for('get_job', job_id=job_id)}), 202
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Status of a background job (e.g. upload processing)"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify(job)
 
 @app.route('/api/data/files', methods=['GET'])
 def list_data_files():
     try:
-        files = [f for f in os.listdir(DATA_FOLDER) if os.path.isfile(os.path.join(DATA_FOLDER, f))]
+        files = [f for f in os.listdir(DATA_FOLDER)
+                 if not f.startswith('.') and os.path.isfile(os.path.join(DATA_FOLDER, f))]
         return jsonify({'success': True, 'files': files})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1158,6 +1935,14 @@ def delete_data_file(filename):
         file_path = os.path.join(DATA_FOLDER, filename)
         if os.path.exists(file_path):
             os.remove(file_path)
+            forget_fingerprints([file_path])
+            workbook_cache.invalidate(file_path)
+            sidecars.remove(file_path)
+            if is_image(filename):
+                prune_image_variants()
+            elif is_markdown(filename):
+                prune_markdown_renders()
+            publish_change('data_changed', file=filename)
             return jsonify({'success': True, 'message': 'File deleted'})
         else:
             return jsonify({'success': False, 'message': 'File not found'}), 404
@@ -1176,10 +1961,14 @@ def create_page():
     if os.path.exists(page_dir):
         return jsonify({'success': False, 'message': 'Folder already exists'}), 400
     try:
-        os.makedirs(page_dir)
-        config_path = os.path.join(page_dir, 'config.json')
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
+        with pages_lock():
+            os.makedirs(page_dir)
+            config_path = os.path.join(page_dir, 'config.json')
+            write_json_atomic(config_path, config)
+            # A new page may reuse an existing order value
+            updated = normalize_page_orders('pages')
+        page_registry.invalidate([folder_name] + updated)
+        publish_change('config_changed', page_id=config.get('id'))
         return jsonify({'success': True, 'message': 'Page created', 'folder': folder_name})
     except Exception as e:
         # Clean up folder if error
@@ -1187,17 +1976,69 @@ def create_page():
             shutil.rmtree(page_dir)
         return jsonify({'success': False, 'message': str(e)}), 500
 
-swagger_template = {
-    "swagger": "2.0",
-    "info": {
-        "title": "PDashboard Modular API",
-        "description": "API para dashboards modulares industriais (v1)",
-        "version": get_version()
-    },
-    "basePath": "/api/v1"
-}
+def swagger_template():
+    return {
+        "swagger": "2.0",
+        "info": {
+            "title": "PDashboard Modular API",
+            "description": "API para dashboards modulares industriais (v1)",
+            "version": get_version()
+        },
+        "basePath": "/api/v1"
+    }
+
+def swag_from(specs):
+    """Attach an OpenAPI spec dict to a view, as flasgger.swag_from does, without importing flasgger"""
+    def decorator(function):
+        function.specs_dict = specs
+        return function
+    return decorator
+
+class LazySwagger:
+    """WSGI middleware serving the Swagger UI and spec from an app built on first use.
+
+    Flask refuses new routes once it has handled a request, so the Flasgger
+    views live in a small separate app created on the first request for
+    them; its spec describes the routes of the dashboard app.
+    """
+
+    PREFIXES = ('/api/v1/docs', '/apispec_1.json', '/apidocs', '/flasgger_static', '/oauth2-redirect.html')
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self._docs = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(self.PREFIXES):
+            return self.docs()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
 
-swagger = Swagger(app, template=swagger_template)
+    def docs(self):
+        with self._lock:
+            if self._docs is None:
+                started = time.perf_counter()
+                flasgger = lazy_import('flasgger')
+                described = self.app
+
+                class DashboardSwagger(flasgger.Swagger):
+                    def get_url_mappings(self, rule_filter=None):
+                        rule_filter = rule_filter or (lambda rule: True)
+                        return [rule for rule in described.url_map.iter_rules() if rule_filter(rule)]
+
+                docs = Flask(__name__, static_folder=None)
+                docs.config['SWAGGER'] = described.config['SWAGGER']
+                DashboardSwagger(docs, template=swagger_template())
+                # The spec generator looks views up by endpoint in the current app
+                for endpoint, view in described.view_functions.items():
+                    docs.view_functions.setdefault(endpoint, view)
+                self._docs = docs
+                startup_timings['swagger'] = round(time.perf_counter() - started, 4)
+                app.logger.info(f"Swagger UI set up in {startup_timings['swagger']:.3f}s")
+        return self._docs
+
+app.wsgi_app = LazySwagger(app)
 api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
 
 # --- API v1 endpoints ---
@@ -1219,6 +2060,15 @@ def api_v1_pages():
 def api_v1_data():
     return get_all_data()
 
+@api_v1.route('/carousel/changes')
+@swag_from({
+    'summary': 'Páginas e widgets do carrossel alterados desde uma versão',
+    'parameters': [{'name': 'since', 'in': 'query', 'type': 'string', 'required': True}],
+    'responses': {200: {'description': 'Alterações desde a versão informada, ou reload quando é preciso recarregar a página', 'examples': {'application/json': {'version': '3f9a1c0d2b7e4a5f6c81', 'reload': False, 'order': ['producao3'], 'changed': [{'id': 'producao3', 'widgets': [{'index': 0, 'widget': {'id': 'widget1'}}]}], 'removed': []}}}}
+})
+def api_v1_carousel_changes():
+    return get_carousel_changes()
+
 @api_v1.route('/data/<page_id>')
 @swag_from({
     'summary': 'Dados de uma página específica',
@@ -1258,6 +2108,15 @@ def api_v1_toggle_page(page_id):
 def api_v1_reorder_pages():
     return reorder_pages()
 
+@api_v1.route('/pages/batch', methods=['POST'])
+@swag_from({
+    'summary': 'Aplica várias alterações de páginas numa única transação',
+    'parameters': [{'name': 'changes', 'in': 'body', 'type': 'object', 'required': True}],
+    'responses': {200: {'description': 'Páginas atualizadas e nova versão da configuração'}, 400: {'description': 'Alterações inválidas'}}
+})
+def api_v1_batch_update_pages():
+    return batch_update_pages()
+
 @api_v1.route('/config')
 @swag_from({
     'summary': 'Configuração global do sistema',
@@ -1287,6 +2146,22 @@ app.register_blueprint(api_v1)
 
 # Swagger UI will be available at /api/v1/docs
 
+def _after_fork_in_child():
+    """Reset per-process state in a worker forked from a preloading master.
+
+    Threads do not survive fork(): futures and flags they were going to
+    resolve would stay pending, and executors would hand work to threads
+    that no longer exist. Background threads, SQLite connections and
+    executors of the other services are created per process already.
+    """
+    global upload_executor
+    upload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload')
+    single_flight.reset()
+    carousel_cache._lock = threading.Lock()
+    carousel_cache._rebuild_pending = False
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
 if __name__ == '__main__':
     # Setup logging
     logger = setup_logging()
@@ -1294,6 +2169,9 @@ if __name__ == '__main__':
     
     # Initialize database
     init_db()
+    if WARMUP:
+        # /api/health answers 503 until it is done
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
     
     # Get configuration
     debug = bool(int(os.environ.get('FLASK_DEBUG', '0')))
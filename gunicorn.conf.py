@@ -0,0 +1,87 @@
+# Gunicorn configuration for PDashboard (production)
+#
+# The gevent worker class lets each worker hold many idle Server-Sent Events
+# connections (/api/events) as cheap greenlets instead of pinning one sync
+# worker per connected display.
+import os
+import sys
+import time
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+
+# Maximum simultaneous connections per gevent worker. Keep it above
+# SSE_MAX_CLIENTS so regular requests still get served when the event
+# stream limit is reached.
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '2000'))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+keepalive = 5
+
+# Import the app once in the master and fork the workers from it, so they
+# start at once and share its memory pages. The app starts no threads at
+# import time and resets its per-process state after fork.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0').lower() in ('1', 'true', 'yes')
+
+def import_app():
+    """Import the application module, recording how long that took in app.startup_timings"""
+    if 'app' in sys.modules:
+        return sys.modules['app']
+    started = time.perf_counter()
+    import app
+    app.startup_timings['import app'] = round(time.perf_counter() - started, 4)
+    return app
+
+if preload_app:
+    if worker_class == 'gevent':
+        # The master imports the app: patch first so its locks and threads are gevent-aware
+        from gevent import monkey
+        monkey.patch_all()
+    import_app()
+
+def on_starting(server):
+    """Resolve duplicate page orders once, before any worker serves requests"""
+    from utils.pages import pages_lock, normalize_page_orders
+    with pages_lock():
+        updated = normalize_page_orders('pages')
+    if updated:
+        server.log.info(f"Normalized page order for: {', '.join(updated)}")
+
+def when_ready(server):
+    if preload_app:
+        app = import_app()
+        server.log.info(f"Application preloaded in {app.startup_timings['import app']:.3f}s")
+        if app.WARMUP:
+            # Warm once here: every worker forked afterwards starts with the pages built
+            app.warm_up()
+            app.close_connections()
+            server.log.info(f"Warm-up done in {app.warmup_state['seconds']:.3f}s")
+
+def pre_fork(server, worker):
+    import threading
+    # Threads do not survive fork(): anything they hold would stay locked in the worker
+    if threading.active_count() > 1:
+        server.log.warning(f"Forking with {threading.active_count() - 1} background thread(s) running in the master")
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+    if not preload_app:
+        # The worker imports the app in load_wsgi, once gevent has patched it: time that import
+        load_wsgi = worker.load_wsgi
+
+        def timed_load_wsgi():
+            import_app()
+            load_wsgi()
+        worker.load_wsgi = timed_load_wsgi
+
+def post_worker_init(worker):
+    app = import_app()
+    if app.WARMUP and app.warmup_state['status'] != 'ready':
+        # The worker only starts accepting connections once this returns. Its
+        # heartbeat loop is not running yet: notify the arbiter after each page
+        # so a long warm-up is not taken for a hung worker (GUNICORN_TIMEOUT)
+        app.warm_up(progress=worker.notify)
+    worker.log.info(f"Worker {worker.pid} ready in {time.perf_counter() - worker.forked_at:.3f}s "
+                    f"(application loaded in {app.startup_timings['import app']:.3f}s"
+                    f"{' by the master' if preload_app else ''})")
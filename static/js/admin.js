@@ -46,7 +46,7 @@ class AdminPanel {
             let dataFileValue = '';
             if (page.type === '3x2' || page.type === '2x2' || page.type === '2x1-graph' || page.type === '2x2-cards') {
                 dataFileLabel = window.t('xlsx_file');
-                dataFileValue = page.config && page.config.xlsx_file ? page.config.xlsx_file : '-';
+                dataFileValue = page.config ? (page.config.source || page.config.xlsx_file || page.config.csv_file || page.config.parquet_file || '-') : '-';
             } else if (page.type === 'text-md') {
                 dataFileLabel = window.t('markdown_file');
                 dataFileValue = page.config && page.config.md_file ? page.config.md_file : '-';
@@ -1,4 +1,6 @@
 // Carousel Auto-Refresh functionality
+// Configuration changes are pushed through /api/events (see carousel.html),
+// so only the footer version is polled here.
 class DashboardCarousel {
     constructor() {
         this.lastConfigHash = null;
@@ -13,11 +15,6 @@ class DashboardCarousel {
         // Update footer version initially
         await this.updateFooterVersion();
         
-        // Set up periodic checking
-        setInterval(() => {
-            this.checkForUpdates();
-        }, this.refreshInterval);
-        
         // Set up periodic version updates
         setInterval(() => {
             this.updateFooterVersion();
@@ -0,0 +1,201 @@
+"""
+Incremental re-parsing of workbooks (WorkbookCache appends) and sidecars
+
+When a new version of a workbook only appended rows to a sheet, the cache
+extends the previous columns instead of reading everything again. Every
+other kind of change must fall back to a full parse, so each case below
+compares the cached result with what a fresh cache reads from the file.
+"""
+
+import os
+import zipfile
+import datetime as dt
+
+import numpy as np
+import openpyxl
+import pytest
+
+from utils.workbooks import InvalidWorkbookError, SheetColumns, SidecarStore, WorkbookCache, stat_fingerprint
+
+HEADERS = ['Month', 'Total', 'Target']
+ROWS = [['Jan', 100, 90], ['Feb', 110, 95], ['Mar', None, 100], ['Apr', 'n/a', 105]]
+SPECS = [('Month', 0), ('Total', 1), ('Target', 2)]
+
+def write_workbook(path, headers, rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Data'
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    # Saves within the same clock tick must still get a new fingerprint
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+def assert_same_sheet(sheet, expected):
+    assert sheet.headers == expected.headers
+    assert sheet.nrows == expected.nrows
+    assert sheet.digest == expected.digest
+    assert sheet.loaded_indices() == expected.loaded_indices()
+    for idx in expected.loaded_indices():
+        assert sheet.column(idx).tolist() == expected.column(idx).tolist()
+        np.testing.assert_array_equal(sheet.numeric(idx), expected.numeric(idx))
+
+@pytest.fixture
+def reparse(tmp_path):
+    """Load a first version of the sheet, rewrite it, and return (cache, cached sheet, fully parsed sheet)"""
+    path = str(tmp_path / 'data.xlsx')
+
+    def run(headers, rows, specs=SPECS):
+        cache = WorkbookCache()
+        write_workbook(path, HEADERS, ROWS)
+        first = cache.sheets(path, {'Data': SPECS})['Data']
+        # Derive the float views too: they are extended along with the columns
+        for idx in first.loaded_indices():
+            first.numeric(idx)
+        write_workbook(path, headers, rows)
+        cached = cache.sheets(path, {'Data': specs})['Data']
+        full = WorkbookCache().sheets(path, {'Data': specs})['Data']
+        return cache, cached, full
+
+    return run
+
+def test_appended_rows_extend_the_previous_columns(reparse):
+    cache, cached, full = reparse(HEADERS, ROWS + [['May', 130, 110], ['Jun', 125.5, None]])
+    assert cache.stats()['appends'] == 1
+    assert cached.nrows == len(ROWS) + 2
+    assert_same_sheet(cached, full)
+
+def test_unchanged_rows_are_not_an_append(reparse):
+    cache, cached, full = reparse(HEADERS, ROWS)
+    assert_same_sheet(cached, full)
+
+@pytest.mark.parametrize('row', [0, 2, len(ROWS) - 1])
+def test_edited_row_forces_a_full_parse(reparse, row):
+    rows = [list(r) for r in ROWS]
+    rows[row][1] = 999
+    cache, cached, full = reparse(HEADERS, rows + [['May', 130, 110]])
+    assert cache.stats()['appends'] == 0
+    assert cached.column(1)[row] == 999
+    assert_same_sheet(cached, full)
+
+def test_edited_row_without_appended_rows_forces_a_full_parse(reparse):
+    rows = [list(r) for r in ROWS]
+    rows[-1][2] = 1
+    cache, cached, full = reparse(HEADERS, rows)
+    assert cache.stats()['appends'] == 0
+    assert_same_sheet(cached, full)
+
+def test_shrunk_sheet_forces_a_full_parse(reparse):
+    cache, cached, full = reparse(HEADERS, ROWS[:2])
+    assert cache.stats()['appends'] == 0
+    assert cached.nrows == 2
+    assert_same_sheet(cached, full)
+
+def test_replaced_last_row_with_more_rows_forces_a_full_parse(reparse):
+    cache, cached, full = reparse(HEADERS, ROWS[:-1] + [['Apr', 1, 2], ['May', 3, 4]])
+    assert cache.stats()['appends'] == 0
+    assert_same_sheet(cached, full)
+
+def test_renamed_header_forces_a_full_parse(reparse):
+    cache, cached, full = reparse(['Month', 'Amount', 'Target'], ROWS + [['May', 130, 110]],
+                                  [('Month', 0), ('Amount', None), ('Target', 2)])
+    assert cache.stats()['appends'] == 0
+    assert cached.headers == ['Month', 'Amount', 'Target']
+    assert_same_sheet(cached, full)
+
+def test_reordered_columns_force_a_full_parse(reparse):
+    rows = [[r[0], r[2], r[1]] for r in ROWS + [['May', 130, 110]]]
+    cache, cached, full = reparse(['Month', 'Target', 'Total'], rows)
+    assert cache.stats()['appends'] == 0
+    assert cached.column(cached.index('Total')).tolist() == [r[1] for r in ROWS] + [130]
+    assert_same_sheet(cached, full)
+
+def test_added_column_forces_a_full_parse(reparse):
+    rows = [r + ['x'] for r in ROWS + [['May', 130, 110]]]
+    cache, cached, full = reparse(HEADERS + ['Note'], rows, SPECS + [('Note', None)])
+    assert cache.stats()['appends'] == 0
+    assert_same_sheet(cached, full)
+
+def test_missing_optional_column_then_append(tmp_path):
+    """A page reading a column the sheet lacks (Cards without Target) keeps working after an append"""
+    path = str(tmp_path / 'data.xlsx')
+    specs = [('Title', 0), ('Value', 1), ('Target', None)]
+    rows = [['A', 1], ['B', 2]]
+    cache = WorkbookCache()
+    write_workbook(path, ['Title', 'Value'], rows)
+    first = cache.sheets(path, {'Data': specs})['Data']
+    for name, default in specs:
+        first.numeric(first.index(name, default))
+    write_workbook(path, ['Title', 'Value'], rows + [['C', 3]])
+    sheet = cache.sheets(path, {'Data': specs})['Data']
+    assert cache.stats()['appends'] == 1
+    assert sheet.numeric(1).tolist() == [1.0, 2.0, 3.0]
+    target = sheet.numeric(sheet.index('Target'))
+    assert target.shape == (3,) and np.isnan(target).all()
+    assert_same_sheet(sheet, WorkbookCache().sheets(path, {'Data': specs})['Data'])
+
+def test_sidecar_keeps_cell_types(tmp_path):
+    path = str(tmp_path / 'data.xlsx')
+    write_workbook(path, HEADERS, ROWS)
+    column = np.empty(9, dtype=object)
+    column[:] = [None, True, 2 ** 70, 1.5, 'txt', dt.datetime(2024, 5, 1, 8, 30, 0, 250),
+                 dt.date(2024, 5, 2), dt.time(7, 45, 3), dt.timedelta(hours=36)]
+    sheet = WorkbookCache().sheets(path, {'Data': SPECS})['Data']
+    sheets = {'Data': sheet, 'Other': SheetColumns(['Mixed'], {0: column}, len(column), 'x', complete=True)}
+    store = SidecarStore(str(tmp_path / 'cache'))
+    store.write(path, stat_fingerprint(path), sheets)
+
+    stored = store.read(path, stat_fingerprint(path), ['Other'])
+    assert list(stored) == ['Other']
+    expected = column.tolist()
+    # Integers beyond int64 are kept as their text
+    expected[2] = str(2 ** 70)
+    values = stored['Other'].column(0).tolist()
+    assert values == expected
+    assert [type(v) for v in values] == [type(v) for v in expected]
+    assert_same_sheet(store.read(path, stat_fingerprint(path))['Data'], sheet)
+
+def test_upload_appends_to_the_sidecar_sheets(tmp_path):
+    """A new upload is re-parsed from the sidecar of the file it replaces"""
+    path = str(tmp_path / 'data.xlsx')
+    store = SidecarStore(str(tmp_path / 'cache'))
+    write_workbook(path, HEADERS, ROWS)
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    first = WorkbookCache().ingest(path, wb, ['Data'])
+    wb.close()
+    store.write(path, stat_fingerprint(path), first)
+
+    cache = WorkbookCache(sidecars=store)
+    upload = str(tmp_path / 'upload.xlsx')
+    write_workbook(upload, HEADERS, ROWS + [['May', 130, 110]])
+    wb = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+    sheets = cache.ingest(path, wb, ['Data', 'Missing'])
+    full = WorkbookCache().ingest(upload, wb, ['Data'])
+    wb.close()
+    assert list(sheets) == ['Data']
+    assert cache.stats()['sidecar_loads'] == 1
+    assert cache.stats()['appends'] == 1
+    assert_same_sheet(sheets['Data'], full['Data'])
+
+    # Once in place, the new version is served from memory
+    os.replace(upload, path)
+    cache.store(path, stat_fingerprint(path), sheets)
+    assert cache.sheets(path, {'Data': SPECS})['Data'] is sheets['Data']
+
+@pytest.mark.parametrize('name, content', [
+    ('text.xlsx', b'not a workbook'),
+    ('empty.xlsx', None),
+    ('data.txt', b'x'),
+])
+def test_open_workbook_rejects_files_that_are_not_workbooks(tmp_path, name, content):
+    path = tmp_path / name
+    if content is None:
+        # A zip archive without the workbook's parts
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('readme.txt', 'x')
+    else:
+        path.write_bytes(content)
+    with pytest.raises(InvalidWorkbookError):
+        WorkbookCache().open_workbook(str(path))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+In-process coordination helpers for PDashboard
+
+SingleFlight coalesces concurrent identical computations within a worker
+(across workers, see utils/shared_cache.py). run_native() runs CPU-bound
+work (workbook parsing) on a real OS thread, so it does not stall a gevent
+worker.
+"""
+
+import threading
+from concurrent.futures import Future
+
+def gevent_active():
+    """Tell whether threading was monkey-patched by gevent (gunicorn gevent workers)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+def run_native(fn, *args):
+    """Call fn(*args) on a real OS thread and return its result.
+
+    Once gevent has patched threading, threads are greenlets: a parse
+    running in one blocks the hub, and with it every request, event stream
+    and the gunicorn heartbeat of the worker. Under gevent the call goes to
+    the hub's pool of native threads and only the calling greenlet waits.
+    fn must only compute: threads it starts or greenlets it wakes would
+    belong to the native thread, whose hub never runs. Without gevent this
+    is a plain call.
+    """
+    if not gevent_active():
+        return fn(*args)
+    from gevent import get_hub
+    return get_hub().threadpool.apply(fn, args)
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into a single computation.
+
+    The first caller runs fn(); callers arriving while it runs wait for its
+    result (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+        try:
+            call.set_result(fn())
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return call.result()
+
+    def reset(self):
+        """Forget in-flight calls (their threads do not exist in a forked child)"""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Dashboard change events for Server-Sent Events clients
+
+EventBroker fans events out to the /api/events streams connected to one
+worker; EventBus carries them between gunicorn workers through the
+`events` table of the SQLite database.
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class EventBroker:
+    """Fan-out of dashboard events to the SSE clients connected to this worker.
+
+    Each client gets a bounded queue; when a slow client falls behind, its
+    oldest pending events are dropped instead of growing memory without
+    limit. The number of clients per worker is capped by max_clients (SSE_MAX_CLIENTS).
+    """
+
+    def __init__(self, max_clients=1000, queue_size=32):
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self._clients = set()
+        self._recent = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def subscribe(self):
+        """Register a client and return its queue, or None if the worker is full"""
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                return None
+            client = queue.Queue(maxsize=self.queue_size)
+            self._clients.add(client)
+            return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def publish(self, event):
+        """Queue an event for every connected client without blocking"""
+        with self._lock:
+            clients = list(self._clients)
+            self._recent[(event.get('type'), event.get('file'))] = time.monotonic()
+        for client in clients:
+            while True:
+                try:
+                    client.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        client.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def published_recently(self, event_type, file=None, window=5.0):
+        """Tell whether an equivalent event went out in the last window seconds"""
+        with self._lock:
+            published_at = self._recent.get((event_type, file))
+        return published_at is not None and time.monotonic() - published_at < window
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'max_clients': self.max_clients,
+                'queue_size': self.queue_size,
+                'dropped': self.dropped
+            }
+
+class EventBus:
+    """Cross-worker pub/sub over the `events` table in the SQLite database.
+
+    Publishing inserts a row; every worker with connected SSE clients runs a
+    listener thread that polls for new rows and hands them to its local
+    EventBroker. No external broker is needed, and the row id doubles as the
+    SSE event id so reconnecting clients can replay what they missed.
+    """
+
+    def __init__(self, db_path, broker, poll_interval=1.0, retention=600):
+        self.db_path = db_path
+        self.broker = broker
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._last_id = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        return conn
+
+    def publish(self, event_type, **data):
+        """Publish an event to the clients of every worker"""
+        event = {'type': event_type, **data, 'timestamp': datetime.now().isoformat()}
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    cursor = conn.execute("INSERT INTO events (event_type, payload) VALUES (?, ?)",
+                                          (event_type, json.dumps(event)))
+                    conn.execute("DELETE FROM events WHERE created_at < datetime('now', ?)",
+                                 (f'-{self.retention} seconds',))
+                event['id'] = cursor.lastrowid
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # Other workers will miss it, but local clients can still be told
+            logger.error(f"Error publishing {event_type} event: {e}")
+            self.broker.publish(event)
+            return None
+        logger.info(f"Published {event_type} event {event['id']}")
+        return event['id']
+
+    def since(self, last_id):
+        """Return the retained events newer than last_id"""
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute("SELECT id, payload FROM events WHERE id > ? ORDER BY id",
+                                    (last_id,)).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading events: {e}")
+            return []
+        return [{**json.loads(payload), 'id': row_id} for row_id, payload in rows]
+
+    def start(self):
+        """Start this worker's listener thread (idempotent, safe after fork)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            try:
+                conn = self._connect()
+                try:
+                    self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error starting event bus: {e}")
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='event-bus', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            for event in self.since(self._last_id):
+                self._last_id = event['id']
+                self.broker.publish(event)
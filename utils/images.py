@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Display-sized variants of the images shown by `image` pages
+
+Uploaded photos are often far larger than the TVs showing them. For every
+source image ImageVariants writes resized, recompressed copies (bounded by
+1080p and 4K, as WebP and JPEG) named after a hash of the source content and
+the encoding settings, so each name always refers to the same bytes and can
+be cached by browsers forever. Files are written to a temporary name and
+renamed into place, so concurrent workers never serve a partial variant.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional: without Pillow the original files are served
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# (label, max width, max height), smallest first
+DISPLAY_SIZES = (('1080p', 1920, 1080), ('4k', 3840, 2160))
+# (extension, Pillow format, mimetype)
+IMAGE_FORMATS = (('webp', 'WEBP', 'image/webp'), ('jpg', 'JPEG', 'image/jpeg'))
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp'}
+
+VARIANT_NAME = re.compile(r'^[0-9a-f]{20}-[0-9a-z]+\.[a-z]+$')
+
+def is_image(filename):
+    return filename.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+class ImageVariants:
+    """Content-addressed resized copies of source images in cache_dir"""
+
+    def __init__(self, cache_dir, quality=82):
+        self.cache_dir = cache_dir
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._digests = {}
+        self.generated = 0
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def digest(self, path, fingerprint):
+        """Hash of the content of path plus the encoding settings, remembered per file version"""
+        key = (os.path.abspath(path), fingerprint)
+        with self._lock:
+            if key in self._digests:
+                return self._digests[key]
+        h = hashlib.sha256(repr((DISPLAY_SIZES, IMAGE_FORMATS, self.quality)).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()[:20]
+        with self._lock:
+            # Only the current version of each file is worth remembering
+            for old in [k for k in self._digests if k[0] == key[0]]:
+                del self._digests[old]
+            self._digests[key] = digest
+        return digest
+
+    def _manifest_path(self, digest):
+        return os.path.join(self.cache_dir, f'{digest}.txt')
+
+    def existing(self, digest):
+        """Return the variants already generated for digest, or None.
+
+        The result maps each extension to a list of (name, width), smallest
+        first. The manifest is written last, so its presence means every
+        variant it lists is complete.
+        """
+        try:
+            with open(self._manifest_path(digest), 'r', encoding='utf-8') as f:
+                lines = f.read().split()
+        except OSError:
+            return None
+        variants = {}
+        for line in lines:
+            name, width = line.rsplit(':', 1)
+            variants.setdefault(name.rsplit('.', 1)[1], []).append((name, int(width)))
+        return variants
+
+    def _write(self, image, name, fmt):
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if fmt == 'JPEG':
+                    image.convert('RGB').save(f, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+                else:
+                    image.save(f, fmt, quality=self.quality, method=4)
+            os.replace(tmp_path, os.path.join(self.cache_dir, name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def generate(self, path, digest):
+        """Write every variant of the image at path and return them (see existing())"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with Image.open(path) as source:
+            source = ImageOps.exif_transpose(source)
+            if source.mode not in ('RGB', 'RGBA'):
+                source = source.convert('RGBA' if 'transparency' in source.info or 'A' in source.mode else 'RGB')
+            lines = []
+            for label, max_width, max_height in DISPLAY_SIZES:
+                image = source.copy()
+                image.thumbnail((max_width, max_height), Image.LANCZOS)
+                for ext, fmt, _ in IMAGE_FORMATS:
+                    name = f'{digest}-{label}.{ext}'
+                    self._write(image, name, fmt)
+                    lines.append(f'{name}:{image.width}')
+                # Larger bounds would only produce the same image again
+                if image.size == source.size:
+                    break
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.cache_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+        os.replace(tmp_path, self._manifest_path(digest))
+        self.generated += 1
+        logger.info(f"Generated {len(lines)} display variants of {os.path.basename(path)}")
+        return self.existing(digest)
+
+    def file_path(self, name):
+        """Path of a variant file, or None if name is not a variant name"""
+        return os.path.join(self.cache_dir, name) if VARIANT_NAME.match(name) else None
+
+    def prune(self, keep):
+        """Delete the variants of every digest not in keep"""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.'):
+                continue
+            if name.split('-', 1)[0].split('.', 1)[0] not in keep:
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
+
+    def stats(self):
+        return {
+            'available': self.available,
+            'quality': self.quality,
+            'generated': self.generated
+        }
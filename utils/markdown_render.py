@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Precompiled HTML for the markdown files shown by `text-md` pages
+
+markdown2 is pure Python and slow on long tables, so a markdown file is only
+compiled once per content: the HTML is stored in cache_dir under a hash of
+the source and the render settings, and kept in memory for the current
+version of each file. Raw HTML in the source is escaped and unsafe link
+schemes are dropped (markdown2's safe mode), so the stored artifact can be
+inserted into the carousel as is.
+"""
+
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+
+import markdown2
+
+logger = logging.getLogger(__name__)
+
+MARKDOWN_EXTRAS = ["fenced-code-blocks", "tables", "strike", "cuddled-lists", "footnotes", "header-ids"]
+SAFE_MODE = 'escape'
+
+class MarkdownRenderer:
+    """Content-addressed cache of rendered markdown files"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._rendered = {}
+        self.hits = 0
+        self.loaded = 0
+        self.compiled = 0
+
+    def _settings(self):
+        return repr((markdown2.__version__, MARKDOWN_EXTRAS, SAFE_MODE)).encode('utf-8')
+
+    def digest(self, source):
+        return hashlib.sha256(self._settings() + source).hexdigest()[:20]
+
+    def _artifact_path(self, digest):
+        return os.path.join(self.cache_dir, f'{digest}.html')
+
+    def compile(self, source):
+        """Render markdown bytes to sanitized HTML"""
+        return markdown2.markdown(source.decode('utf-8'), extras=MARKDOWN_EXTRAS, safe_mode=SAFE_MODE)
+
+    def _store(self, digest, html):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(tmp_path, self._artifact_path(digest))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def render(self, path, fingerprint):
+        """Return (digest, html) for the markdown file at path in its version `fingerprint`"""
+        key = (os.path.abspath(path), fingerprint)
+        with self._lock:
+            if key in self._rendered:
+                self.hits += 1
+                return self._rendered[key]
+        with open(path, 'rb') as f:
+            source = f.read()
+        digest = self.digest(source)
+        try:
+            with open(self._artifact_path(digest), 'r', encoding='utf-8') as f:
+                html = f.read()
+            self.loaded += 1
+        except OSError:
+            html = self.compile(source)
+            self.compiled += 1
+            try:
+                self._store(digest, html)
+            except OSError as e:
+                logger.error(f"Error storing rendered {os.path.basename(path)}: {e}")
+        with self._lock:
+            # Only the current version of each file is worth remembering
+            for old in [k for k in self._rendered if k[0] == key[0]]:
+                del self._rendered[old]
+            self._rendered[key] = (digest, html)
+        return digest, html
+
+    def prune(self, keep):
+        """Delete the stored HTML of every digest not in keep"""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.startswith('.') and name.split('.', 1)[0] not in keep:
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            files = len(self._rendered)
+        return {
+            'files': files,
+            'hits': self.hits,
+            'loaded': self.loaded,
+            'compiled': self.compiled
+        }
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Serialized write path for page configuration files
+
+Every change to pages/*/config.json or pages/config.json goes through
+pages_lock() and write_json_atomic(), so concurrent gunicorn workers never
+interleave writes and readers never see a half-written file.
+"""
+
+import os
+import json
+import fcntl
+import logging
+import tempfile
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = '.lock'
+
+@contextmanager
+def pages_lock(pages_dir='pages'):
+    """Hold an exclusive lock on the pages folder (across processes)"""
+    os.makedirs(pages_dir, exist_ok=True)
+    with open(os.path.join(pages_dir, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file next to path and rename it into place"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_page_configs(pages_dir='pages'):
+    """Return {folder: config} for every pages/<folder>/config.json"""
+    configs = {}
+    if not os.path.exists(pages_dir):
+        return configs
+    for page_dir in os.listdir(pages_dir):
+        config_file = os.path.join(pages_dir, page_dir, 'config.json')
+        if not os.path.isfile(config_file):
+            continue
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                configs[page_dir] = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading page config {config_file}: {e}")
+    return configs
+
+def _renumber_duplicate_orders(configs):
+    """Assign sequential order values in place if any are duplicated; return changed folders"""
+    order_values = [config.get('order', 999) for config in configs.values()]
+    if len(order_values) == len(set(order_values)):
+        return []
+    logger.warning("Found duplicate order values in config files, resolving...")
+    ordered = sorted(configs.items(), key=lambda item: (item[1].get('order', 999), item[1].get('title', '')))
+    renumbered = []
+    for i, (page_dir, config) in enumerate(ordered):
+        if config.get('order') != i + 1:
+            config['order'] = i + 1
+            logger.info(f"Updated order for {config.get('id', page_dir)} to {i + 1}")
+            renumbered.append(page_dir)
+    return renumbered
+
+def _commit(pages_dir, configs, page_dirs):
+    """Write the given folders' configs: all temp files first, then all renames"""
+    staged = []
+    try:
+        for page_dir in page_dirs:
+            path = os.path.join(pages_dir, page_dir, 'config.json')
+            fd, tmp_path = tempfile.mkstemp(prefix='.config.json.', suffix='.tmp', dir=os.path.dirname(path))
+            staged.append((tmp_path, path))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(configs[page_dir], f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        # Nothing has been renamed yet, so the old configs are untouched
+        for tmp_path, _ in staged:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+    for tmp_path, path in staged:
+        os.replace(tmp_path, path)
+
+def normalize_page_orders(pages_dir='pages'):
+    """Reassign sequential order values if two pages share the same one.
+
+    Must be called with pages_lock() held. Only files whose order actually
+    changes are rewritten. Returns the folders that were updated.
+    """
+    configs = read_page_configs(pages_dir)
+    updated = _renumber_duplicate_orders(configs)
+    _commit(pages_dir, configs, updated)
+    return updated
+
+def commit_page_changes(changes, pages_dir='pages'):
+    """Apply a batch of page changes in a single pass and commit them together.
+
+    `changes` maps page ids to a dict with any of `order`, `active` and
+    `config` (fields merged into the page config). Every config is read
+    once, all changes are validated and applied in memory, order collisions
+    are resolved, and only then are the modified files written. Unknown
+    page ids raise KeyError before anything touches the disk.
+
+    Must be called with pages_lock() held. Returns the folders that changed.
+    """
+    configs = read_page_configs(pages_dir)
+    dir_by_id = {config.get('id'): page_dir for page_dir, config in configs.items()}
+    unknown = [page_id for page_id in changes if page_id not in dir_by_id]
+    if unknown:
+        raise KeyError(f"Unknown page(s): {', '.join(map(str, unknown))}")
+
+    updated = set()
+    for page_id, change in changes.items():
+        page_dir = dir_by_id[page_id]
+        config = configs[page_dir]
+        before = dict(config)
+        for key, value in (change.get('config') or {}).items():
+            if key not in ('id', '_dir'):
+                config[key] = value
+        if 'order' in change:
+            config['order'] = int(change['order'])
+        if 'active' in change:
+            config['active'] = bool(change['active'])
+        if config != before:
+            updated.add(page_dir)
+    if updated:
+        updated.update(_renumber_duplicate_orders(configs))
+    _commit(pages_dir, configs, sorted(updated))
+    return sorted(updated)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with pages_lock():
+        updated = normalize_page_orders()
+    print(f"Updated: {', '.join(updated)}" if updated else "No duplicate orders found")
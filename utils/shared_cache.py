@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Cross-worker cache for PDashboard
+
+Gunicorn workers are separate processes, so anything cached in memory is
+computed once per worker. SharedCache keeps entries in a SQLite table that
+every worker on the host opens:
+
+- keys are versioned: an entry only answers a lookup for its own version,
+  an entry of an older version can still be served as stale
+- the total size is bounded: least recently used entries are evicted
+- a lease per key makes sure only one worker recomputes a missing entry
+  while the others wait for it (or serve the stale one)
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class SharedCache:
+    """SQLite-backed key/value cache shared by every worker process"""
+
+    def __init__(self, db_path, max_bytes=64 * 1024 * 1024, lease_seconds=60, wait_interval=0.1):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.lease_seconds = lease_seconds
+        self.wait_interval = wait_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def _connection(self):
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_cache (
+                key TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_shared_cache_accessed ON shared_cache (accessed_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_cache_leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def _owner(self):
+        return f'{os.getpid()}:{threading.get_ident()}'
+
+    def lookup(self, key):
+        """Return (version, value) for key whatever its version, or None"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                row = conn.execute("SELECT version, value FROM shared_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE shared_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return (row[0], bytes(row[1])) if row is not None else None
+
+    def get(self, key, version):
+        """Return the value stored for key at this version, or None"""
+        entry = self.lookup(key)
+        return entry[1] if entry is not None and entry[0] == version else None
+
+    def set(self, key, version, value):
+        """Store bytes for key at version, evicting least recently used entries above max_bytes"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO shared_cache (key, version, value, size, accessed_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (key, version, value, len(value), time.time()))
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM shared_cache").fetchone()[0]
+                if total <= self.max_bytes:
+                    return
+                for old_key, size in conn.execute("SELECT key, size FROM shared_cache WHERE key != ? "
+                                                  "ORDER BY accessed_at", (key,)).fetchall():
+                    conn.execute("DELETE FROM shared_cache WHERE key = ?", (old_key,))
+                    self.evictions += 1
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM shared_cache WHERE key = ?", (key,))
+
+    def acquire(self, key):
+        """Take the lease on key unless another live owner holds it; return True if taken"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO shared_cache_leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE shared_cache_leases.expires_at < ?",
+                    (key, self._owner(), now + self.lease_seconds, now))
+        return cursor.rowcount == 1
+
+    def release(self, key):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM shared_cache_leases WHERE key = ? AND owner = ?", (key, self._owner()))
+
+    @contextmanager
+    def lease(self, key):
+        """Hold the lease on key for the block; yields whether it was acquired"""
+        acquired = self.acquire(key)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release(key)
+
+    def single_flight(self, key, load, compute, stale=None):
+        """Run compute() in one worker at a time for key.
+
+        load() returns the result if it is already available, None otherwise.
+        While another worker holds the lease, `stale` is returned right away
+        if given; otherwise load() is retried until the result shows up or
+        the lease expires (then the caller computes it itself).
+        """
+        deadline = time.time() + self.lease_seconds
+        while True:
+            if self.acquire(key):
+                try:
+                    # The previous holder may have just finished it
+                    result = load()
+                    return result if result is not None else compute()
+                finally:
+                    self.release(key)
+            if stale is not None:
+                self.stale += 1
+                return stale
+            time.sleep(self.wait_interval)
+            result = load()
+            if result is not None:
+                self.waits += 1
+                return result
+            if time.time() >= deadline:
+                logger.warning(f"Lease on {key} expired, computing it in this worker")
+                return compute()
+
+    def get_or_compute(self, key, version, compute, serve_stale=True):
+        """Return the value of key at version, computing it (once across workers) if missing.
+
+        compute() must return bytes. With serve_stale, a worker that finds
+        another one already computing a new version gets the previous
+        version's value instead of waiting.
+        """
+        try:
+            entry = self.lookup(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+
+            def build():
+                self.misses += 1
+                value = compute()
+                try:
+                    self.set(key, version, value)
+                except sqlite3.Error as e:
+                    logger.error(f"Error storing {key} in the shared cache: {e}")
+                return value
+
+            stale = entry[1] if serve_stale and entry is not None else None
+            return self.single_flight(key, lambda: self.get(key, version), build, stale)
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache unavailable for {key}: {e}")
+            return compute()
+
+    def stats(self):
+        try:
+            with self._lock:
+                entries, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM shared_cache").fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        return {
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'stale': self.stale,
+            'evictions': self.evictions
+        }
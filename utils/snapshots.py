@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Precomputed widget payloads of data pages
+
+WidgetEngine keeps the last good payload of every data page as a
+PageSnapshot and rebuilds it off the request path when its inputs change.
+SnapshotStore persists snapshots in the `dashboard_data` table, so they
+survive restarts and are shared by every gunicorn worker.
+
+The engine does not know how pages are configured: the app passes it the
+function building a page's widgets and the ones resolving its data file.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.concurrency import SingleFlight, run_native
+
+logger = logging.getLogger(__name__)
+
+def snapshot_version(key):
+    return hashlib.sha1(json.dumps(key, default=str).encode('utf-8')).hexdigest()[:16]
+
+class PageSnapshot:
+    """Last good widget payload of a page and the inputs it was built from"""
+
+    def __init__(self, key, widgets, build_seconds, built_at=None):
+        self.key = key
+        self.version = snapshot_version(key)
+        self.widgets = widgets
+        self.data_fingerprint = key[2]
+        self.built_at = built_at or time.time()
+        self.build_seconds = round(build_seconds, 4)
+
+    @property
+    def age(self):
+        return time.time() - self.built_at
+
+class SnapshotStore:
+    """Computed page snapshots persisted in the `dashboard_data` table.
+
+    One row per widget (data_type 'widget') plus one marker row per page
+    (data_type 'page'), all tagged with the snapshot version, so a page is
+    loaded with a single indexed query. Rows survive restarts and are shared
+    by every gunicorn worker. Each worker keeps one WAL-mode connection.
+    `dumps` serializes the widgets (the app passes its JSON provider, so
+    stored and fresh payloads render the same).
+    """
+
+    COLUMNS = (('page_id', 'TEXT'), ('widget_id', 'TEXT'), ('version', 'TEXT'),
+               ('position', 'INTEGER'), ('build_seconds', 'REAL'), ('built_at', 'REAL'))
+
+    def __init__(self, db_path, dumps=json.dumps):
+        self.db_path = db_path
+        self.dumps = dumps
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self.loads = 0
+        self.saves = 0
+
+    def _connection(self):
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS dashboard_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data_type TEXT NOT NULL,
+                data_json TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Workers start together: take the write lock before checking the columns
+        conn.execute("BEGIN IMMEDIATE")
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(dashboard_data)")}
+        for name, sql_type in self.COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE dashboard_data ADD COLUMN {name} {sql_type}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_dashboard_data_page ON dashboard_data (page_id, version)")
+        conn.commit()
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def load(self, key):
+        """Return the stored PageSnapshot for a snapshot key, or None"""
+        page_id = key[0]
+        try:
+            with self._lock:
+                rows = self._connection().execute(
+                    "SELECT data_type, data_json, build_seconds, built_at FROM dashboard_data "
+                    "WHERE page_id = ? AND version = ? ORDER BY position", (page_id, snapshot_version(key))).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error loading snapshot of page {page_id}: {e}")
+            return None
+        marker = [row for row in rows if row[0] == 'page']
+        if not marker:
+            return None
+        widgets = [json.loads(data_json) for data_type, data_json, _, _ in rows if data_type == 'widget']
+        self.loads += 1
+        return PageSnapshot(key, widgets, marker[0][2], built_at=marker[0][3])
+
+    def save(self, snapshot):
+        """Replace the stored rows of the snapshot's page with this snapshot"""
+        page_id = snapshot.key[0]
+        rows = [('page', json.dumps({'key': snapshot.key}), page_id, None, -1)]
+        rows += [('widget', self.dumps(widget), page_id, widget.get('id'), position)
+                 for position, widget in enumerate(snapshot.widgets)]
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute("DELETE FROM dashboard_data WHERE page_id = ?", (page_id,))
+                    conn.executemany(
+                        "INSERT INTO dashboard_data (data_type, data_json, page_id, widget_id, position, "
+                        "version, build_seconds, built_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [row + (snapshot.version, snapshot.build_seconds, snapshot.built_at) for row in rows])
+        except sqlite3.Error as e:
+            logger.error(f"Error saving snapshot of page {page_id}: {e}")
+            return
+        self.saves += 1
+
+class WidgetEngine:
+    """Widget payloads of data pages, precomputed off the request path.
+
+    Each page keeps a snapshot of its last good payload, tagged with the page
+    config and data file version it was built from. Requests always read the
+    snapshot: when its inputs changed, or the page's `refresh_interval`
+    (seconds) elapsed, a rebuild is queued on a thread pool and the old
+    snapshot keeps being served until the new one is ready; the build itself
+    runs on a native thread (see run_native). Only a page that was never
+    built is computed while the request waits. Built snapshots are written
+    to the store, and a rebuild first looks there for a snapshot of the same
+    version made by another worker or before a restart. A shared lease per
+    page lets a single worker parse the workbook while the others keep
+    serving their snapshot or wait for the new one.
+
+    The app provides build(page) -> widgets, data_file(page) -> path or
+    None, fingerprint(path), active_pages() -> the active data pages, and
+    reread(path), called before a `refresh_interval` rebuild so the file is
+    read again even if its fingerprint did not change.
+    """
+
+    def __init__(self, store, shared, build, data_file, fingerprint, active_pages, reread=None,
+                 single_flight=None, workers=2, tick=5.0):
+        self.store = store
+        self.shared = shared
+        self.build = build
+        self.data_file = data_file
+        self.fingerprint = fingerprint
+        self.active_pages = active_pages
+        self.reread = reread
+        self.single_flight = single_flight or SingleFlight()
+        self.workers = workers
+        self.tick = tick
+        self._snapshots = {}
+        self._pending = {}
+        self._failed = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._executor = None
+        self._thread = None
+        self._pid = None
+        self.builds = 0
+        self.failures = 0
+
+    def _key(self, page):
+        config_digest = hashlib.sha1(json.dumps(page, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        data_path = self.data_file(page)
+        return (page['id'], config_digest, self.fingerprint(data_path) if data_path else None)
+
+    def subscribe(self, callback):
+        """Register callback(page_ids) to be called when rebuilt payloads differ from the previous ones"""
+        self._callbacks.append(callback)
+
+    def snapshot(self, page):
+        """Return the current PageSnapshot for a page, queueing a rebuild if it is out of date"""
+        data_path = self.data_file(page)
+        if data_path and self.fingerprint(data_path) is None:
+            with self._lock:
+                self._snapshots.pop(page['id'], None)
+            raise FileNotFoundError(data_path)
+        snapshot = self._snapshots.get(page['id'])
+        if snapshot is None:
+            key = self._key(page)
+            return self.single_flight.do(('snapshot', key), lambda: self._submit(page, key).result())
+        self.refresh(page, snapshot)
+        return snapshot
+
+    def refresh(self, page, snapshot=None):
+        """Queue a background rebuild if the page's snapshot is missing, outdated or expired"""
+        snapshot = snapshot or self._snapshots.get(page['id'])
+        key = self._key(page)
+        if self._failed.get(page['id']) == key:
+            return None
+        if snapshot is None or snapshot.key != key:
+            return self._submit(page, key)
+        interval = page.get('refresh_interval')
+        if interval and snapshot.age >= float(interval):
+            return self._submit(page, key, reload=True)
+        return None
+
+    def warm(self, pages, progress=None):
+        """Build the snapshots of pages in the calling thread (no thread pool: safe before fork).
+
+        progress(), if given, is called after each page, e.g. to send the
+        gunicorn heartbeat during a long warm-up.
+        """
+        for page in pages:
+            data_path = self.data_file(page)
+            if data_path and self.fingerprint(data_path) is None:
+                continue
+            try:
+                self._build(page, self._key(page), False, native=False)
+            except Exception as e:
+                logger.error(f"Error warming page {page['id']}: {e}")
+            if progress is not None:
+                progress()
+
+    def refresh_all(self):
+        """Queue rebuilds for every active page whose snapshot is out of date"""
+        for page in self.active_pages():
+            try:
+                self.refresh(page)
+            except Exception as e:
+                logger.error(f"Error scheduling refresh of page {page['id']}: {e}")
+
+    def _submit(self, page, key, reload=False):
+        with self._lock:
+            future = self._pending.get(page['id'])
+            if future is not None and not future.done():
+                return future
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='data-refresh')
+                self._pid = os.getpid()
+            future = self._executor.submit(self._build, page, key, reload)
+            self._pending[page['id']] = future
+            return future
+
+    def _load(self, key, max_age=None):
+        snapshot = self.store.load(key)
+        if snapshot is not None and max_age is not None and snapshot.age >= max_age:
+            return None
+        return snapshot
+
+    def _build(self, page, key, reload, native=True):
+        # refresh_interval: a stored snapshot of the same version only counts if it is recent enough
+        max_age = float(page['refresh_interval']) if reload else None
+        snapshot = self._load(key, max_age)
+        if snapshot is None:
+            try:
+                snapshot = self.shared.single_flight(f"snapshot:{page['id']}", lambda: self._load(key, max_age),
+                                                     lambda: self._compute(page, key, reload, native),
+                                                     stale=self._snapshots.get(page['id']))
+            except sqlite3.Error as e:
+                logger.error(f"Shared lease unavailable for page {page['id']}: {e}")
+                snapshot = self._compute(page, key, reload, native)
+        widgets = snapshot.widgets
+        with self._lock:
+            previous = self._snapshots.get(page['id'])
+            self._snapshots[page['id']] = snapshot
+            self._failed.pop(page['id'], None)
+        if previous is not None and previous.widgets != widgets:
+            for callback in self._callbacks:
+                try:
+                    callback([page['id']])
+                except Exception as e:
+                    logger.error(f"Error in data refresh callback: {e}")
+        return snapshot
+
+    def _compute(self, page, key, reload, native=True):
+        data_path = self.data_file(page)
+        if reload and data_path and self.reread is not None:
+            self.reread(data_path)
+        started = time.perf_counter()
+        try:
+            widgets = run_native(self.build, page) if native else self.build(page)
+        except Exception as e:
+            with self._lock:
+                self._failed[page['id']] = key
+                self.failures += 1
+            logger.error(f"Error building widgets for page {page['id']}: {e}")
+            raise
+        snapshot = PageSnapshot(key, widgets, time.perf_counter() - started)
+        self.store.save(snapshot)
+        with self._lock:
+            self.builds += 1
+        return snapshot
+
+    def widgets(self, page):
+        """Return the (shared, read-only) widget list for a page"""
+        return self.snapshot(page).widgets
+
+    def widget(self, page, widget_id):
+        for widget in self.widgets(page):
+            if widget.get('id') == widget_id:
+                return widget
+        return None
+
+    def version(self, page):
+        """Version of the snapshot served for a page, or None if it cannot be built"""
+        try:
+            return self.snapshot(page).version
+        except Exception:
+            return None
+
+    def start(self):
+        """Start this worker's scheduler thread (idempotent, safe after fork)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='data-refresh')
+            self._pid = os.getpid()
+            self._pending.clear()
+            self._thread = threading.Thread(target=self._run, name='data-scheduler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            active_ids = set()
+            try:
+                for page in self.active_pages():
+                    active_ids.add(page['id'])
+                    self.refresh(page)
+            except Exception as e:
+                logger.error(f"Error in data refresh scheduler: {e}")
+            with self._lock:
+                for page_id in [p for p in self._snapshots if p not in active_ids]:
+                    del self._snapshots[page_id]
+            time.sleep(self.tick)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'builds': self.builds,
+                'loaded': self.store.loads,
+                'failures': self.failures,
+                'pending': sum(1 for future in self._pending.values() if not future.done()),
+                'pages': {
+                    page_id: {
+                        'age_seconds': round(snapshot.age, 1),
+                        'build_seconds': snapshot.build_seconds,
+                        'failing': page_id in self._failed
+                    }
+                    for page_id, snapshot in self._snapshots.items()
+                }
+            }
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Filesystem watcher for out-of-band edits to pages/ and data/
+
+Uses inotify on Linux (through ctypes, no extra dependency) and falls back
+to polling stat() snapshots elsewhere. Subscribers get each burst of
+changed paths once the folders have been quiet for a moment.
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                 IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+def _ignored_name(name):
+    # Hidden/temporary files: editor swap files, atomic-write temp files, caches
+    return name.startswith('.') or name.endswith('~') or name.endswith('.tmp')
+
+class FileWatcher:
+    """Background watcher for the pages/ and data/ folders.
+
+    Uses inotify on Linux (through ctypes, no extra dependency) and falls
+    back to polling stat() snapshots elsewhere or when FS_WATCHER=poll.
+    Changes are collected until the folders have been quiet for `debounce`
+    seconds, then the subscribed callbacks get the whole burst at once.
+    When the kernel's event queue overflowed and changes were lost, the
+    callbacks get None instead: anything under the roots may have changed.
+    """
+
+    def __init__(self, roots, mode='auto', debounce=2.0, poll_interval=2.0):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.mode = mode
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def running(self):
+        return self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+
+    def covers(self, path):
+        """Tell whether changes to the file at path are reported (a root or one folder below it)"""
+        path = os.path.abspath(path)
+        for root in self.roots:
+            if path.startswith(root + os.sep):
+                parts = os.path.relpath(path, root).split(os.sep)
+                return len(parts) <= 2 and not any(_ignored_name(part) for part in parts)
+        return False
+
+    def subscribe(self, callback):
+        """Register callback(paths) to be called with each burst of changed paths (None: unknown)"""
+        self._callbacks.append(callback)
+
+    def start(self):
+        """Start the watcher thread for this process (idempotent, safe after fork)"""
+        if self.mode == 'off' or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            inotify_fd = self._init_inotify() if self.mode in ('auto', 'inotify') else None
+            if inotify_fd is not None:
+                self.backend = 'inotify'
+                target, args = self._run_inotify, (inotify_fd,)
+            else:
+                # Take the first snapshot now so nothing changed after start() is missed
+                self.backend = 'poll'
+                target, args = self._run_poll, (self._snapshot(),)
+            self._thread = threading.Thread(target=target, args=args, name='fs-watcher', daemon=True)
+            self._thread.start()
+        logger.info(f"Filesystem watcher started ({self.backend}) on {', '.join(self.roots)}")
+
+    def _dispatch(self, paths):
+        for callback in self._callbacks:
+            try:
+                callback(paths)
+            except Exception as e:
+                logger.error(f"Error handling filesystem changes: {e}")
+
+    # inotify backend
+
+    def _init_inotify(self):
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify unavailable, polling instead: {e}")
+            return None
+        if fd < 0:
+            logger.info("inotify_init1 failed, polling instead")
+            return None
+        self._libc = libc
+        self._watches = {}
+        self._add_watches(fd)
+        return fd
+
+    def _add_watches(self, fd):
+        """Watch the roots and their subfolders (adding an existing watch is a no-op)"""
+        for root in self.roots:
+            self._add_watch(fd, root)
+            if os.path.isdir(root):
+                for name in os.listdir(root):
+                    if not _ignored_name(name) and os.path.isdir(os.path.join(root, name)):
+                        self._add_watch(fd, os.path.join(root, name))
+
+    def _add_watch(self, fd, path):
+        wd = self._libc.inotify_add_watch(fd, path.encode('utf-8'), IN_WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = path
+
+    def _run_inotify(self, fd):
+        import select
+        import struct
+        header = struct.Struct('iIII')
+        pending = set()
+        overflowed = False
+        while True:
+            readable, _, _ = select.select([fd], [], [], self.debounce)
+            if not readable:
+                if overflowed:
+                    # Folders created meanwhile were never watched
+                    self._add_watches(fd)
+                    self._dispatch(None)
+                elif pending:
+                    self._dispatch(pending)
+                pending, overflowed = set(), False
+                continue
+            try:
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset + header.size <= len(data):
+                wd, mask, _, length = header.unpack_from(data, offset)
+                name = data[offset + header.size:offset + header.size + length].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += header.size + length
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning("inotify event queue overflowed, rescanning everything")
+                    overflowed = True
+                    continue
+                directory = self._watches.get(wd)
+                if directory is None or (name and _ignored_name(name)):
+                    continue
+                path = os.path.join(directory, name) if name else directory
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and os.path.dirname(path) in self.roots:
+                    self._add_watch(fd, path)
+                pending.add(path)
+
+    # Polling backend
+
+    def _snapshot(self):
+        snapshot = {}
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                # Only look one level below the watched roots (pages/<page>/config.json)
+                dirnames[:] = [d for d in dirnames if not _ignored_name(d) and dirpath == root]
+                for name in filenames:
+                    if _ignored_name(name):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        return snapshot
+
+    def _run_poll(self, previous):
+        pending = set()
+        last_change = 0.0
+        while True:
+            time.sleep(self.poll_interval)
+            current = self._snapshot()
+            changed = {path for path in previous.keys() | current.keys()
+                       if previous.get(path) != current.get(path)}
+            previous = current
+            if changed:
+                pending |= changed
+                last_change = time.monotonic()
+            elif pending and time.monotonic() - last_change >= self.debounce:
+                self._dispatch(pending)
+                pending = set()
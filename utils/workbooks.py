@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Columnar extraction of the worksheets behind data pages
+
+WorkbookCache reads only the sheets and columns a page needs (openpyxl in
+read-only streaming mode, pandas/pyarrow for CSV and Parquet) into
+SheetColumns, keeps them in a bounded LRU keyed by file fingerprint, and
+re-parses only the appended rows when a new version of a workbook just
+added rows to a sheet. SidecarStore holds the columns extracted when a
+workbook was uploaded, so no worker has to parse it again.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import datetime as dt
+import importlib
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# CSV and Parquet files hold a single table, read whatever `sheet` a widget names
+TABLE_SOURCE_EXTENSIONS = ('.csv', '.parquet')
+
+def is_table_source(path):
+    return path.lower().endswith(TABLE_SOURCE_EXTENSIONS)
+
+def safe_float(val):
+    if val is None:
+        return None
+    if isinstance(val, dt.datetime):
+        return None
+    if isinstance(val, (int, float)):
+        return float(val)
+    if isinstance(val, str):
+        try:
+            return float(val)
+        except ValueError:
+            return None
+    return None
+
+def stat_fingerprint(path):
+    """Return (mtime_ns, size, inode) for a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+# Cell types kept in sidecars, each stored as a typed array (no pickles).
+# Code 0 is an empty cell; anything else is stored as its text.
+_CELL_DTYPES = {1: np.bool_, 2: np.int64, 3: np.float64, 4: np.str_, 5: 'datetime64[us]',
+                6: 'datetime64[D]', 7: 'timedelta64[us]', 8: 'timedelta64[us]'}
+_INT64_MIN, _INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+def _cell_kind(val):
+    if val is None:
+        return 0, None
+    if isinstance(val, bool):
+        return 1, val
+    if isinstance(val, int):
+        return (2, val) if _INT64_MIN <= val <= _INT64_MAX else (4, str(val))
+    if isinstance(val, float):
+        return 3, val
+    if isinstance(val, str):
+        return 4, val
+    if isinstance(val, dt.datetime):
+        return (5, val) if val.tzinfo is None else (4, str(val))
+    if isinstance(val, dt.date):
+        return 6, val
+    if isinstance(val, dt.time):
+        if val.tzinfo is not None:
+            return 4, str(val)
+        return 7, dt.timedelta(hours=val.hour, minutes=val.minute, seconds=val.second,
+                               microseconds=val.microsecond)
+    if isinstance(val, dt.timedelta):
+        return 8, val
+    return 4, str(val)
+
+def encode_column(column):
+    """Split an object column into {'kinds': uint8 codes, '<code>': typed values} arrays"""
+    kinds = np.zeros(len(column), dtype=np.uint8)
+    values = {}
+    for row, val in enumerate(column):
+        kind, val = _cell_kind(val)
+        if kind:
+            kinds[row] = kind
+            values.setdefault(kind, []).append(val)
+    arrays = {'kinds': kinds}
+    for kind, vals in values.items():
+        arrays[str(kind)] = np.array(vals, dtype=_CELL_DTYPES[kind])
+    return arrays
+
+def decode_column(arrays):
+    """Rebuild the object column written by encode_column()"""
+    kinds = arrays['kinds']
+    column = np.full(len(kinds), None, dtype=object)
+    for kind in _CELL_DTYPES:
+        if str(kind) not in arrays:
+            continue
+        # tolist() turns each typed array back into Python ints, strs, datetimes...
+        vals = arrays[str(kind)].tolist()
+        if kind == 7:
+            vals = [(dt.datetime.min + val).time() for val in vals]
+        part = np.empty(len(vals), dtype=object)
+        part[:] = vals
+        column[kinds == kind] = part
+    return column
+
+class InvalidWorkbookError(ValueError):
+    """An uploaded file that openpyxl cannot open as a workbook"""
+
+class SheetColumns:
+    """Columnar data extracted from one worksheet.
+
+    Holds the header row and the extracted columns as NumPy object arrays
+    (original cell values, one entry per data row). Float views of a column,
+    with NaN for anything non-numeric, are derived once and reused for the
+    vectorized trend/target computations. `digest` hashes the extracted
+    rows, so a later version of the file can be checked for being this one
+    plus appended rows.
+    """
+
+    def __init__(self, headers, columns, nrows, digest=None, complete=False):
+        self.headers = headers
+        self.nrows = nrows
+        self.digest = digest
+        # Every column of the sheet was extracted
+        self.complete = complete
+        self._columns = columns
+        self._numeric = {}
+
+    def index(self, name, default=None):
+        return self.headers.index(name) if name and name in self.headers else default
+
+    def loaded(self, indices):
+        if self.complete:
+            return True
+        return all(idx is None or idx in self._columns for idx in indices)
+
+    def loaded_indices(self):
+        return set(self._columns)
+
+    def column(self, idx):
+        """Original values of column idx (all None if the column does not exist)"""
+        if idx is None or idx not in self._columns:
+            return np.full(self.nrows, None, dtype=object)
+        return self._columns[idx]
+
+    def numeric(self, idx):
+        """Float64 values of column idx, NaN where a cell is not a number"""
+        if idx is None or idx not in self._columns:
+            # Absent column (e.g. an optional Target): all NaN, not cached
+            return np.full(self.nrows, np.nan)
+        if idx not in self._numeric:
+            values = [safe_float(v) for v in self._columns[idx]]
+            self._numeric[idx] = np.array(values, dtype=np.float64) if values else np.empty(0)
+        return self._numeric[idx]
+
+    def extend(self, tail, nrows, digest):
+        """Return a new SheetColumns with the tail columns appended to these ones"""
+        columns = {idx: np.concatenate([column, tail[idx]]) for idx, column in self._columns.items()}
+        extended = SheetColumns(self.headers, columns, self.nrows + nrows, digest, self.complete)
+        for idx, numeric in self._numeric.items():
+            if idx not in tail:
+                continue
+            tail_numeric = np.array([safe_float(v) for v in tail[idx]], dtype=np.float64)
+            extended._numeric[idx] = np.concatenate([numeric, tail_numeric])
+        return extended
+
+class WorkbookCache:
+    """Process-wide LRU cache of columns extracted from workbooks.
+
+    Entries are per worksheet, keyed by the absolute path plus the file
+    fingerprint (mtime/size/inode), so a workbook replaced on disk is
+    reparsed on the next lookup even if nobody invalidated it explicitly.
+    Sheets are taken from the file's upload sidecar when there is one
+    (see SidecarStore); otherwise workbooks are opened in openpyxl's
+    read-only streaming mode and only the requested sheets, up to the last
+    requested column, are read. The previous version of a sheet is kept:
+    when the new file only appended rows to it, just the new rows are
+    converted and the old columns are extended.
+    """
+
+    def __init__(self, max_entries=64, fingerprint=stat_fingerprint, sidecars=None,
+                 importer=importlib.import_module):
+        self.max_entries = max_entries
+        self.fingerprint = fingerprint
+        self.sidecars = sidecars
+        self.importer = importer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.appends = 0
+        self.sidecar_loads = 0
+
+    def sheets(self, path, wanted):
+        """Return {sheet_name: SheetColumns} for the workbook at path.
+
+        `wanted` maps sheet names to lists of (column_name, default_index)
+        specs; a column missing from the header falls back to its default
+        index (or is absent if the default is None).
+        """
+        path = os.path.abspath(path)
+        fingerprint = self.fingerprint(path)
+        if fingerprint is None:
+            raise FileNotFoundError(path)
+        result, missing = {}, {}
+        with self._lock:
+            for sheet_name, specs in wanted.items():
+                key = (path, fingerprint, sheet_name)
+                sheet = self._entries.get(key)
+                if sheet is not None and sheet.loaded([sheet.index(name, default) for name, default in specs]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    result[sheet_name] = sheet
+                else:
+                    self.misses += 1
+                    previous = None
+                    if sheet is None:
+                        # An earlier version of the file, to re-parse incrementally from
+                        previous = next((v for k, v in reversed(self._entries.items())
+                                         if k[0] == path and k[2] == sheet_name), None)
+                    missing[sheet_name] = (specs, sheet.loaded_indices() if sheet is not None else set(), previous)
+        if missing:
+            loaded = self._load(path, missing, fingerprint)
+            self.store(path, fingerprint, loaded)
+            result.update(loaded)
+        return result
+
+    def store(self, path, fingerprint, sheets):
+        """Cache {sheet_name: SheetColumns} extracted from the version of path with this fingerprint"""
+        path = os.path.abspath(path)
+        with self._lock:
+            # Drop the older versions of these sheets before storing the new ones
+            for stale in [k for k in self._entries
+                          if k[0] == path and k[1] != fingerprint and k[2] in sheets]:
+                del self._entries[stale]
+            for sheet_name, sheet in sheets.items():
+                self._entries[(path, fingerprint, sheet_name)] = sheet
+                self._entries.move_to_end((path, fingerprint, sheet_name))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def open_workbook(self, path):
+        """Open an uploaded workbook in read-only mode.
+
+        Raises InvalidWorkbookError when the file is not a workbook (not a
+        zip archive, not a spreadsheet format openpyxl knows, or missing
+        parts of the package); any other failure propagates unchanged.
+        """
+        openpyxl = self.importer('openpyxl')
+        invalid = self.importer('openpyxl.utils.exceptions').InvalidFileException
+        try:
+            return openpyxl.load_workbook(path, read_only=True, data_only=True)
+        except KeyError as e:
+            raise InvalidWorkbookError(e.args[0] if e.args else str(e)) from e
+        except (zipfile.BadZipFile, invalid) as e:
+            raise InvalidWorkbookError(str(e)) from e
+
+    def ingest(self, path, wb, sheet_names):
+        """Extract every column of the named sheets of wb, an upload that is to replace path.
+
+        wb is an upload opened with open_workbook(); sheets it lacks are
+        left out. A sheet that only gained rows since the current version of
+        path (see latest) is extended from it instead of converted again.
+        Nothing is cached: call store() once the upload is in place.
+        """
+        previous = self.latest(path, sheet_names)
+        return {name: self._extract(wb[name], [], set(), previous.get(name), all_columns=True)
+                for name in sheet_names if name in wb.sheetnames}
+
+    def _load(self, path, missing, fingerprint):
+        if is_table_source(path):
+            return {name: self._extract_table(path, specs, keep) for name, (specs, keep, _) in missing.items()}
+        loaded = {}
+        stored = self.sidecars.read(path, fingerprint, missing) if self.sidecars is not None else None
+        if stored:
+            loaded = {name: stored[name] for name in missing if name in stored}
+            with self._lock:
+                self.sidecar_loads += len(loaded)
+            if len(loaded) == len(missing):
+                return loaded
+        wb = self.importer('openpyxl').load_workbook(path, read_only=True, data_only=True)
+        try:
+            for sheet_name, (specs, keep, previous) in missing.items():
+                if sheet_name in loaded:
+                    continue
+                if sheet_name not in wb.sheetnames:
+                    raise KeyError(f"Worksheet {sheet_name} does not exist.")
+                loaded[sheet_name] = self._extract(wb[sheet_name], specs, keep, previous)
+            return loaded
+        finally:
+            wb.close()
+
+    def _extract(self, ws, specs, keep, previous=None, all_columns=False):
+        rows = ws.iter_rows(values_only=True)
+        header_row = next(rows, None)
+        headers = list(header_row) if header_row else []
+        if all_columns:
+            indices = set(range(len(headers)))
+        else:
+            indices = {headers.index(name) if name in headers else default for name, default in specs} | keep
+        indices.discard(None)
+        if previous is not None and previous.headers == headers and previous.nrows:
+            # Extract the same columns as before so the row hashes are comparable
+            indices |= previous.loaded_indices()
+            appendable = indices == previous.loaded_indices()
+        else:
+            appendable = False
+        if not indices:
+            return SheetColumns(headers, {}, 0, complete=all_columns)
+        order = sorted(indices)
+        max_col = order[-1] + 1
+        skip = previous.nrows if appendable else 0
+        values = {idx: [] for idx in order}
+        hasher = hashlib.sha1()
+        nrows = 0
+        for row in ws.iter_rows(min_row=2, max_col=max_col, values_only=True):
+            cells = tuple(row[idx] if idx < len(row) else None for idx in order)
+            hasher.update(repr(cells).encode('utf-8'))
+            nrows += 1
+            if nrows <= skip:
+                if nrows == skip and hasher.hexdigest() != previous.digest:
+                    # Earlier rows changed: start over with a full parse
+                    return self._extract(ws, specs, keep, all_columns=all_columns)
+                continue
+            for idx, cell in zip(order, cells):
+                values[idx].append(cell)
+        if nrows < skip:
+            return self._extract(ws, specs, keep, all_columns=all_columns)
+        columns = {}
+        for idx, column in values.items():
+            array = np.empty(nrows - skip, dtype=object)
+            array[:] = column
+            columns[idx] = array
+        if appendable:
+            with self._lock:
+                self.appends += 1
+            return previous.extend(columns, nrows - skip, hasher.hexdigest())
+        return SheetColumns(headers, columns, nrows, hasher.hexdigest(), all_columns)
+
+    def _extract_table(self, path, specs, keep):
+        """Read the requested columns of a CSV or Parquet file (a single table)"""
+        parquet = path.lower().endswith('.parquet')
+        if parquet:
+            try:
+                pq = self.importer('pyarrow.parquet')
+            except ImportError:  # Optional: only needed for Parquet data sources
+                raise RuntimeError("Parquet data sources require the pyarrow package")
+        else:
+            pd = self.importer('pandas')
+        headers = list(pq.read_schema(path).names if parquet else pd.read_csv(path, nrows=0).columns)
+        indices = {headers.index(name) if name in headers else default for name, default in specs} | keep
+        indices = {idx for idx in indices if idx is not None and idx < len(headers)}
+        names = [headers[idx] for idx in sorted(indices)]
+        if parquet:
+            frame = pq.read_table(path, columns=names, memory_map=True).to_pandas()
+        else:
+            frame = pd.read_csv(path, usecols=names, memory_map=True)
+        columns = {}
+        for idx in indices:
+            series = frame[headers[idx]].astype(object)
+            # Missing cells are None, as with openpyxl
+            columns[idx] = series.where(series.notna(), None).to_numpy()
+        return SheetColumns(headers, columns, len(frame))
+
+    def latest(self, path, sheet_names):
+        """Return {sheet: SheetColumns} for the current version of path, with every column extracted.
+
+        Only what is already at hand is returned (complete cache entries, then
+        the file's sidecar); nothing is parsed. This is what a replacement of
+        the file is re-parsed incrementally from.
+        """
+        path = os.path.abspath(path)
+        fingerprint = self.fingerprint(path)
+        if fingerprint is None:
+            return {}
+        found = {}
+        with self._lock:
+            for name in sheet_names:
+                sheet = self._entries.get((path, fingerprint, name))
+                if sheet is not None and sheet.complete:
+                    found[name] = sheet
+        rest = [name for name in sheet_names if name not in found]
+        if rest and self.sidecars is not None and not is_table_source(path):
+            stored = self.sidecars.read(path, fingerprint, rest) or {}
+            with self._lock:
+                self.sidecar_loads += len(stored)
+            found.update(stored)
+        return found
+
+    def invalidate(self, path=None):
+        """Drop cached entries for path, or everything if path is None"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            path = os.path.abspath(path)
+            for stale in [k for k in self._entries if k[0] == path]:
+                del self._entries[stale]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'appends': self.appends,
+                'sidecar_loads': self.sidecar_loads,
+                'evictions': self.evictions
+            }
+
+class SidecarStore:
+    """Columns extracted from uploaded workbooks, stored next to the data.
+
+    cache_dir/<file>/<fingerprint hash>/ holds a JSON manifest, the original
+    cell values of each sheet as typed arrays in an .npz (see encode_column)
+    and float64 .npy columns (memory-mapped when read). `dumps` serializes
+    the manifest (the app passes its JSON provider, so header cells that are
+    dates come out as in the API responses).
+    """
+
+    def __init__(self, cache_dir, dumps=json.dumps):
+        self.cache_dir = cache_dir
+        self.dumps = dumps
+
+    def path(self, path, fingerprint):
+        digest = hashlib.sha1(repr(tuple(fingerprint)).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, os.path.basename(path), digest)
+
+    def write(self, path, fingerprint, sheets):
+        """Store extracted SheetColumns for this version of path and drop older sidecars"""
+        final_dir = self.path(path, fingerprint)
+        parent = os.path.dirname(final_dir)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+        try:
+            manifest = {'source': os.path.basename(path), 'fingerprint': list(fingerprint), 'sheets': {}}
+            for n, (name, sheet) in enumerate(sheets.items()):
+                indices = sorted(sheet.loaded_indices())
+                entry = {'headers': sheet.headers, 'nrows': sheet.nrows, 'digest': sheet.digest,
+                         'values': f'{n}.npz', 'columns': indices, 'numeric': {}}
+                arrays = {}
+                for idx in indices:
+                    for part, array in encode_column(sheet.column(idx)).items():
+                        arrays[f'{idx}_{part}'] = array
+                np.savez(os.path.join(tmp_dir, entry['values']), **arrays)
+                for idx in indices:
+                    numeric = sheet.numeric(idx)
+                    if numeric.size and not np.isnan(numeric).all():
+                        entry['numeric'][str(idx)] = f'{n}_{idx}.npy'
+                        np.save(os.path.join(tmp_dir, entry['numeric'][str(idx)]), numeric)
+                manifest['sheets'][name] = entry
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                f.write(self.dumps(manifest))
+            if os.path.isdir(final_dir):
+                shutil.rmtree(tmp_dir)
+            else:
+                os.rename(tmp_dir, final_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        for name in os.listdir(parent):
+            if os.path.join(parent, name) != final_dir:
+                shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+    def read(self, path, fingerprint, names=None):
+        """Return {sheet: SheetColumns} from the sidecar of this version of path, or None.
+
+        Only the sheets in `names` are loaded (all of them if names is None).
+        """
+        directory = self.path(path, fingerprint)
+        try:
+            with open(os.path.join(directory, 'manifest.json'), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            sheets = {}
+            for name, entry in manifest['sheets'].items():
+                if names is not None and name not in names:
+                    continue
+                columns = {}
+                with np.load(os.path.join(directory, entry['values']), allow_pickle=False) as stored:
+                    for idx in entry['columns']:
+                        prefix = f'{idx}_'
+                        columns[idx] = decode_column({key[len(prefix):]: stored[key] for key in stored.files
+                                                      if key.startswith(prefix)})
+                sheet = SheetColumns(entry['headers'], columns, entry['nrows'], entry['digest'], complete=True)
+                for idx, filename in entry['numeric'].items():
+                    sheet._numeric[int(idx)] = np.load(os.path.join(directory, filename), mmap_mode='r')
+                sheets[name] = sheet
+            return sheets
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable sidecar for {path}: {e}")
+            return None
+
+    def remove(self, path):
+        shutil.rmtree(os.path.join(self.cache_dir, os.path.basename(path)), ignore_errors=True)